@@ -1,18 +1,37 @@
-from flask import Flask, request, jsonify, send_file, send_from_directory, render_template_string
+from flask import Flask, Request, Response, request, jsonify, redirect, send_file, send_from_directory, render_template_string
 import os
 import json
 import zipfile
-import rarfile
 import tempfile
 import shutil
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+from urllib.parse import quote
 import logging
+import hashlib
+import re
 import uuid
+import time
 import threading
 import fcntl
+import mimetypes
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from metadata_store import create_metadata_store
+from reconciler import Reconciler
+from retention import Purger, load_rules
+from search_index import SearchIndex
+from compression import CompressionCache, is_compressible, parse_accept_encoding
+from text_preview import LineIndexCache, stream_text_preview, read_byte_window
+from jobs import JobManager, JobQueueFull
+import archives
+import metrics
 
 app = Flask(__name__, static_folder='static')
+metrics.init_app(app)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -31,67 +50,204 @@ ALLOWED_EXTENSIONS = {
 # 确保上传目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# 文件锁，用于保护JSON文件的并发访问
-metadata_lock = threading.Lock()
+# 上传临时目录，与最终存储位于同一文件系统，保证重命名是原子的
+UPLOAD_TMP_FOLDER = os.path.join(UPLOAD_FOLDER, '.tmp')
+os.makedirs(UPLOAD_TMP_FOLDER, exist_ok=True)
 
-def safe_read_metadata():
-    """线程安全地读取元数据文件"""
-    metadata_file = os.path.join(UPLOAD_FOLDER, 'file_metadata.json')
-    
-    if not os.path.exists(metadata_file):
-        return []
+# 单个上传文件的最大字节数，设为0不限制
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 1024 * 1024 * 1024))
+if MAX_UPLOAD_SIZE:
+    # 请求头 Content-Length 超限时在读取请求体之前直接拒绝
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
+
+class HashingUploadStream:
+    """边接收边写入磁盘的上传文件流
+
+    werkzeug 解析 multipart 时按块写入此对象：数据直接落到上传临时目录，
+    同一遍计算 SHA-256 和字节数，超过大小限制立即中止；保存时原子重命名到目标路径。
+    """
+
+    def __init__(self, directory, max_size):
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload_', suffix='.part', delete=False)
+        self.temp_path = self._file.name
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+        self.committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size and self.size > self.max_size:
+            raise RequestEntityTooLarge(f'File exceeds the maximum upload size of {self.max_size} bytes')
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def commit(self, target_path):
+        """将临时文件原子地重命名到目标路径"""
+        self._file.close()
+        os.replace(self.temp_path, target_path)
+        self.committed = True
+
+    def close(self):
+        # 请求结束时未保存的临时文件直接删除
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class StreamingRequest(Request):
+    """上传文件直接流式写入上传临时目录，不经过内存或系统临时目录缓冲"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = HashingUploadStream(UPLOAD_TMP_FOLDER, MAX_UPLOAD_SIZE)
+        # 解析中途失败时 werkzeug 不会保留该文件，需要自行记录以便请求结束时清理
+        self.__dict__.setdefault('_upload_streams', []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        for stream in self.__dict__.get('_upload_streams', []):
+            stream.close()
+
+app.request_class = StreamingRequest
+
+def save_uploaded_file(file, file_path):
+    """保存上传文件到目标路径，返回 (字节数, SHA-256)"""
+    stream = file.stream
+    if isinstance(stream, HashingUploadStream):
+        stream.commit(file_path)
+        return stream.size, stream.sha256.hexdigest()
     
-    with metadata_lock:
+    # 非流式解析的文件（理论上不会出现）退回到逐块复制
+    sha256 = hashlib.sha256()
+    size = 0
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    with open(temp_path, 'wb') as f:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+            sha256.update(chunk)
+            size += len(chunk)
+            f.write(chunk)
+    os.replace(temp_path, file_path)
+    return size, sha256.hexdigest()
+
+# 文本类报告的压缩缓存：上传、解压后后台预压缩，下载时按 Accept-Encoding 直接发送
+COMPRESSED_CACHE_MAX_BYTES = int(os.environ.get('COMPRESSED_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+COMPRESS_MAX_FILE_SIZE = int(os.environ.get('COMPRESS_MAX_FILE_SIZE', 50 * 1024 * 1024))
+compression_cache = CompressionCache(UPLOAD_FOLDER, os.path.join(UPLOAD_FOLDER, '.compressed'),
+                                     COMPRESSED_CACHE_MAX_BYTES, COMPRESS_MAX_FILE_SIZE)
+# 上传后的预压缩、压缩包清单等后台工作
+background_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='background')
+
+def schedule_precompress(path):
+    """后台预压缩文件或目录，不阻塞请求"""
+    def task():
         try:
-            with open(metadata_file, 'r', encoding='utf-8') as f:
-                # 在Unix系统上使用文件锁
-                if hasattr(fcntl, 'flock'):
-                    fcntl.flock(f.fileno(), fcntl.LOCK_SH)
-                
-                try:
-                    metadata = json.load(f)
-                finally:
-                    if hasattr(fcntl, 'flock'):
-                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-                
-                return metadata
+            if os.path.isdir(path):
+                compression_cache.precompress_tree(path)
+            elif is_compressible(path):
+                compression_cache.precompress(path)
         except Exception as e:
-            logger.error(f"Error reading metadata: {str(e)}")
-            return []
+            logger.warning(f"Precompress failed for {path}: {str(e)}")
+    background_executor.submit(task)
 
-def safe_write_metadata(metadata):
-    """线程安全地写入元数据文件"""
-    metadata_file = os.path.join(UPLOAD_FOLDER, 'file_metadata.json')
-    
-    with metadata_lock:
+# 全文检索索引：上传、生成清单、解压后在后台增量写入，设为0关闭
+SEARCH_INDEX_ENABLED = os.environ.get('SEARCH_INDEX', '1') == '1'
+SEARCH_MAX_CONTENT_BYTES = int(os.environ.get('SEARCH_MAX_CONTENT_BYTES', 4 * 1024 * 1024))
+SEARCH_MAX_RANKED = int(os.environ.get('SEARCH_MAX_RANKED', 10000))
+search_index = SearchIndex(os.path.join(UPLOAD_FOLDER, '.search', 'index.db'),
+                           SEARCH_MAX_CONTENT_BYTES, SEARCH_MAX_RANKED) if SEARCH_INDEX_ENABLED else None
+
+def schedule_search_index(record, listing=None, force=False, extract_dir=None):
+    """后台为记录建立检索文档；指定 extract_dir 时只索引解压目录"""
+    if search_index is None:
+        return
+    def task():
         try:
-            # 先写入临时文件
-            temp_file = metadata_file + '.tmp'
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                # 在Unix系统上使用文件锁
-                if hasattr(fcntl, 'flock'):
-                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-                
-                try:
-                    json.dump(metadata, f, ensure_ascii=False, indent=2)
-                    f.flush()
-                    os.fsync(f.fileno())  # 确保数据写入磁盘
-                finally:
-                    if hasattr(fcntl, 'flock'):
-                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-            
-            # 原子性地替换文件
-            os.replace(temp_file, metadata_file)
-            return True
+            if extract_dir:
+                search_index.index_tree(record, extract_dir, UPLOAD_FOLDER)
+            else:
+                search_index.index_record(record, UPLOAD_FOLDER, listing, force)
         except Exception as e:
-            logger.error(f"Error writing metadata: {str(e)}")
-            # 清理临时文件
-            if os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
+            logger.warning(f"Search indexing failed for {record.get('file_path')}: {str(e)}")
+    background_executor.submit(task)
+
+# 解压任务：有界线程池后台执行，状态保存在 uploads/.jobs/
+EXTRACT_WORKERS = int(os.environ.get('EXTRACT_WORKERS', 2))
+EXTRACT_MAX_PENDING = int(os.environ.get('EXTRACT_MAX_PENDING', 16))
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', 7 * 24 * 3600))
+job_manager = JobManager(os.path.join(UPLOAD_FOLDER, '.jobs'), EXTRACT_WORKERS, EXTRACT_MAX_PENDING)
+
+# 内容寻址去重存储：相同内容的文件通过硬链接共享 .blobs 下同一份数据，设为1开启
+DEDUP_STORAGE = os.environ.get('DEDUP_STORAGE', '0') == '1'
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, '.blobs')
+
+def blob_path_for(sha256):
+    """按 SHA-256 计算 blob 存放路径"""
+    return os.path.join(BLOB_FOLDER, sha256[:2], sha256)
+
+def link_blob(blob_path, file_path):
+    """用指向 blob 的硬链接原子地替换目标文件"""
+    if os.path.exists(file_path) and os.path.samefile(blob_path, file_path):
+        # 已经是同一个 inode，rename 不会生效
+        return
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.link"
+    os.link(blob_path, temp_path)
+    os.replace(temp_path, file_path)
+
+def deduplicate_file(file_path, sha256):
+    """将已落盘的文件纳入去重存储，返回是否复用了已有内容
+
+    blob 的硬链接数即引用计数：内容首次出现时 blob 作为该文件的另一个链接，
+    已存在时用指向 blob 的链接替换刚写入的副本，副本占用的空间随即释放。
+    """
+    blob_path = blob_path_for(sha256)
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    for _ in range(2):
+        try:
+            os.link(file_path, blob_path)
             return False
+        except FileExistsError:
+            pass
+        try:
+            link_blob(blob_path, file_path)
+            return True
+        except FileNotFoundError:
+            # blob 恰好在此期间被回收，重试时由本文件重新建立
+            continue
+    return False
+
+def release_blob(sha256):
+    """文件删除后，若 blob 不再被任何文件引用则回收，返回是否回收"""
+    if not sha256:
+        return False
+    blob_path = blob_path_for(sha256)
+    try:
+        if os.stat(blob_path).st_nlink <= 1:
+            os.remove(blob_path)
+            return True
+    except FileNotFoundError:
+        pass
+    return False
+
+def cleanup_orphan_blobs():
+    """回收没有任何文件引用的 blob（例如同路径重新上传覆盖了旧文件），返回回收数"""
+    removed = 0
+    if not os.path.isdir(BLOB_FOLDER):
+        return removed
+    for prefix in os.listdir(BLOB_FOLDER):
+        prefix_dir = os.path.join(BLOB_FOLDER, prefix)
+        for name in os.listdir(prefix_dir):
+            removed += release_blob(name)
+    if removed:
+        logger.info(f"Removed {removed} unreferenced blob(s)")
+    return removed
+
+# 元数据存储后端（json / journal / sqlite，由环境变量 METADATA_BACKEND 指定）
+metadata_store = create_metadata_store(UPLOAD_FOLDER)
+metrics.instrument_store(metadata_store)
 
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
@@ -104,14 +260,17 @@ def create_directory_structure(base_path, relative_path, date_str):
     os.makedirs(full_path, exist_ok=True)
     return full_path
 
-def save_file_info(filename, relative_path, date_str, file_path):
-    """保存文件信息到元数据文件"""
-    # 线程安全地读取现有元数据
-    metadata = safe_read_metadata()
-    
+def new_file_info(filename, relative_path, date_str, file_path, file_size=None, sha256=None, extra=None):
+    """构建文件的元数据记录（已知大小时不再访问磁盘），extra 为附加字段"""
     # 生成唯一UUID
     file_uuid = str(uuid.uuid4())
     
+    if file_size is None:
+        file_exists = os.path.exists(file_path)
+        file_size = os.path.getsize(file_path) if file_exists else 0
+    else:
+        file_exists = True
+    
     # 添加新文件信息
     file_info = {
         'uuid': file_uuid,  # 唯一标识符
@@ -120,50 +279,236 @@ def save_file_info(filename, relative_path, date_str, file_path):
         'date': date_str,
         'file_path': file_path,
         'upload_time': datetime.now().isoformat(),
-        'file_size': os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        'file_size': file_size,
+        'exists': file_exists,
+        'current_size': file_size
     }
+    if sha256:
+        file_info['sha256'] = sha256
+    if extra:
+        file_info.update(extra)
     
-    metadata.append(file_info)
+    return file_info
+
+def annotate_file_info(record):
+    """为查询结果附加存在状态和新文件标识（复制记录，不修改缓存）"""
+    file_info = dict(record)
     
-    # 线程安全地保存元数据
-    if not safe_write_metadata(metadata):
-        raise Exception("Failed to save metadata")
+    # 存在状态由上传、删除和后台巡检维护；旧记录缺少该字段时才检查磁盘
+    if 'exists' not in file_info:
+        file_info['exists'] = os.path.exists(file_info['file_path'])
+        file_info['current_size'] = os.path.getsize(file_info['file_path']) if file_info['exists'] else 0
+    
+    # 添加新文件标识（24小时内上传且未查看的文件）
+    try:
+        upload_time = datetime.fromisoformat(file_info['upload_time'].replace('Z', '+00:00'))
+        is_recently_uploaded = upload_time > datetime.now() - timedelta(hours=24)
+        is_viewed = file_info.get('viewed', False)
+        file_info['is_new'] = is_recently_uploaded and not is_viewed
+    except:
+        file_info['is_new'] = False
     
     return file_info
 
+# 文件状态巡检使用与命令行对账工具相同的实现，按批在线程池中检查
+file_reconciler = Reconciler(metadata_store, UPLOAD_FOLDER,
+                             workers=int(os.environ.get('RECONCILE_WORKERS', 4)))
+
+def reconcile_file_state():
+    """巡检所有记录对应的文件，批量更新 exists / current_size，返回更新条数"""
+    report = file_reconciler.run(orphans='ignore')
+    if report['updated_records']:
+        logger.info(f"File state reconciled: {report['updated_records']} record(s) updated")
+    return report['updated_records']
+
+def run_file_state_reconciler(interval):
+    """后台定期巡检文件状态；多个worker之间通过文件锁保证同一时间只有一个在执行"""
+    lock_path = os.path.join(UPLOAD_FOLDER, '.reconcile.lock')
+    while True:
+        try:
+            with open(lock_path, 'a') as lock_fd:
+                try:
+                    fcntl.flock(lock_fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    pass
+                else:
+                    try:
+                        reconcile_file_state()
+                        cleanup_orphan_blobs()
+                        compression_cache.enforce_limit()
+                        job_manager.cleanup(JOB_RETENTION_SECONDS)
+                        cleanup_orphan_listings()
+                        sync_search_index()
+                    finally:
+                        fcntl.flock(lock_fd.fileno(), fcntl.LOCK_UN)
+        except Exception as e:
+            logger.error(f"File state reconcile error: {str(e)}")
+        time.sleep(interval)
+
+# 文件状态巡检间隔（秒），设为0关闭
+FILE_STATE_RECONCILE_INTERVAL = int(os.environ.get('FILE_STATE_RECONCILE_INTERVAL', 300))
+if FILE_STATE_RECONCILE_INTERVAL > 0:
+    threading.Thread(target=run_file_state_reconciler, args=(FILE_STATE_RECONCILE_INTERVAL,),
+                     name='file-state-reconciler', daemon=True).start()
+
+def extracted_dir_for(full_path):
+    """压缩包对应的解压目录：与压缩包同目录的 <文件名>_extracted"""
+    return os.path.join(os.path.dirname(full_path), f"{os.path.splitext(os.path.basename(full_path))[0]}_extracted")
+
+def remove_stored_file(record, remove_extracted=False):
+    """删除记录对应的文件及其预压缩副本、行索引，可选删除解压目录，返回实际释放的文件字节数"""
+    file_path = record.get('file_path', '')
+    freed = 0
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        stat = None
+    if stat is not None:
+        os.remove(file_path)
+        # 去重存储中最后一个引用删除时才真正回收空间
+        if stat.st_nlink <= 1:
+            freed = stat.st_size
+        elif release_blob(record.get('sha256')):
+            freed = stat.st_size
+            logger.info(f"Blob reclaimed: {record.get('sha256')}")
+    compression_cache.remove(file_path)
+    line_index_cache.remove(file_path)
+    
+    if search_index is not None and record.get('uuid'):
+        search_index.remove(record['uuid'])
+    
+    if remove_extracted:
+        extract_dir = extracted_dir_for(file_path)
+        if os.path.isdir(extract_dir):
+            shutil.rmtree(extract_dir, ignore_errors=True)
+            compression_cache.remove_tree(extract_dir)
+            line_index_cache.remove_tree(extract_dir)
+    return freed
+
+# 保留策略：规则来自 RETENTION_RULES（JSON 文本）或 RETENTION_CONFIG（JSON 文件），未配置时不清理
+retention_purger = Purger(
+    metadata_store,
+    load_rules(os.environ.get('RETENTION_RULES'), os.environ.get('RETENTION_CONFIG')),
+    lambda record: remove_stored_file(record, remove_extracted=True),
+    batch_size=int(os.environ.get('PURGE_BATCH_SIZE', 100)),
+    max_files_per_second=float(os.environ.get('PURGE_MAX_FILES_PER_SEC', 50)),
+    max_bytes_per_second=float(os.environ.get('PURGE_MAX_BYTES_PER_SEC', 200 * 1024 * 1024))
+)
+
+def run_retention_purger(interval):
+    """后台定期按保留规则清理；多个worker之间通过文件锁保证同一时间只有一个在执行"""
+    lock_path = os.path.join(UPLOAD_FOLDER, '.retention.lock')
+    while True:
+        try:
+            with open(lock_path, 'a') as lock_fd:
+                try:
+                    fcntl.flock(lock_fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    pass
+                else:
+                    try:
+                        retention_purger.run()
+                    finally:
+                        fcntl.flock(lock_fd.fileno(), fcntl.LOCK_UN)
+        except Exception as e:
+            logger.error(f"Retention purge error: {str(e)}")
+        time.sleep(interval)
+
+# 保留策略清理间隔（秒），设为0关闭
+RETENTION_INTERVAL = int(os.environ.get('RETENTION_INTERVAL', 3600))
+if RETENTION_INTERVAL > 0 and retention_purger.rules:
+    threading.Thread(target=run_retention_purger, args=(RETENTION_INTERVAL,),
+                     name='retention-purger', daemon=True).start()
+
 def is_archive_file(filename):
     """检查是否为压缩包文件"""
     archive_extensions = {'zip', 'rar', '7z', 'tar', 'gz', 'bz2', 'xz'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in archive_extensions
 
+# 解压限制：解压后总字节数、成员数量，以及 zip 并行解压线程数
+EXTRACT_MAX_TOTAL_SIZE = int(os.environ.get('EXTRACT_MAX_TOTAL_SIZE', 5 * 1024 * 1024 * 1024))
+EXTRACT_MAX_MEMBERS = int(os.environ.get('EXTRACT_MAX_MEMBERS', 100000))
+EXTRACT_THREADS = int(os.environ.get('EXTRACT_THREADS', 4))
+
+# 压缩包成员清单：上传时生成并保存，预览、成员列表和直接访问成员时读取，不再重复打开压缩包
+listing_store = archives.ListingStore(os.path.join(UPLOAD_FOLDER, '.listings'))
+
+def listing_key_for(full_path, record=None):
+    """清单的 key：有 SHA-256 时按内容寻址（去重的文件共用同一份清单），否则按路径、大小和修改时间"""
+    if record is None:
+        record = metadata_store.find_by_file_path(full_path)
+    if record and record.get('listing_key'):
+        return record['listing_key']
+    if record and record.get('sha256'):
+        return record['sha256']
+    stat = os.stat(full_path)
+    key = f"{os.path.relpath(full_path, UPLOAD_FOLDER)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return 'p' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def load_archive_listing(full_path, key=None):
+    """读取与当前文件一致的已保存清单，没有时返回 None"""
+    key = key or listing_key_for(full_path)
+    listing = listing_store.load(key)
+    if listing is None:
+        return None
+    stat = os.stat(full_path)
+    if listing.get('archive_size') != stat.st_size:
+        return None
+    # 按路径生成的 key 还需要修改时间一致；按内容寻址的 key 大小一致即可
+    if key.startswith('p') and listing.get('archive_mtime_ns') != stat.st_mtime_ns:
+        return None
+    return listing
+
+def get_archive_listing(full_path, key=None):
+    """读取压缩包清单，没有或已过期时重新生成并保存"""
+    key = key or listing_key_for(full_path)
+    listing = load_archive_listing(full_path, key)
+    if listing is None:
+        listing = archives.build_listing(full_path)
+        listing_store.save(key, listing)
+    return listing
+
+def cleanup_orphan_listings(min_age=3600):
+    """删除没有元数据记录引用的清单（按路径生成的清单只是缓存，超过 min_age 后同样清理）"""
+    referenced = {record.get('listing_key') for record in metadata_store.snapshot().records}
+    cutoff = time.time() - min_age
+    removed = 0
+    for key, mtime in list(listing_store.keys()):
+        if key not in referenced and mtime < cutoff:
+            listing_store.remove(key)
+            removed += 1
+    if removed:
+        logger.info(f"Orphan archive listings removed: {removed}")
+    return removed
+
+# 每次巡检最多补齐的检索文档数，首次开启时存量报告分多轮建立索引
+SEARCH_SYNC_BATCH = int(os.environ.get('SEARCH_SYNC_BATCH', 5000))
+
+def sync_search_index():
+    """补齐缺少检索文档的记录，删除已删除记录的文档"""
+    if search_index is None:
+        return
+    added, removed = search_index.sync(
+        metadata_store.snapshot().records,
+        UPLOAD_FOLDER,
+        listing_loader=lambda record: listing_store.load(record['listing_key']) if record.get('listing_key') else None,
+        extract_dir_for=lambda record: extracted_dir_for(record.get('file_path', '')),
+        max_records=SEARCH_SYNC_BATCH
+    )
+    if added or removed:
+        logger.info(f"Search index synced: {added} added, {removed} removed")
+
+def archive_info_from_listing(listing):
+    """清单转换为接口返回的压缩包信息（只列出前10个文件）"""
+    info = archives.listing_summary(listing)
+    info['file_list'] = listing['names'][:10]
+    info['has_more'] = len(listing['names']) > 10
+    return info
+
 def extract_archive_info(archive_path):
     """提取压缩包信息"""
     try:
-        file_ext = os.path.splitext(archive_path)[1].lower()
-        
-        if file_ext == '.zip':
-            with zipfile.ZipFile(archive_path, 'r') as zip_file:
-                file_list = zip_file.namelist()
-                total_size = sum(info.file_size for info in zip_file.filelist)
-                return {
-                    'type': 'zip',
-                    'file_count': len(file_list),
-                    'total_size': total_size,
-                    'file_list': file_list[:10],  # 只显示前10个文件
-                    'has_more': len(file_list) > 10
-                }
-        elif file_ext == '.rar':
-            with rarfile.RarFile(archive_path, 'r') as rar_file:
-                file_list = rar_file.namelist()
-                total_size = sum(info.file_size for info in rar_file.infolist())
-                return {
-                    'type': 'rar',
-                    'file_count': len(file_list),
-                    'total_size': total_size,
-                    'file_list': file_list[:10],  # 只显示前10个文件
-                    'has_more': len(file_list) > 10
-                }
-        else:
+        if archives.archive_type(archive_path) is None:
             return {
                 'type': 'unknown',
                 'file_count': 0,
@@ -171,6 +516,8 @@ def extract_archive_info(archive_path):
                 'file_list': [],
                 'has_more': False
             }
+        
+        return archive_info_from_listing(get_archive_listing(archive_path))
     except Exception as e:
         logger.error(f"Error extracting archive info: {str(e)}")
         return {
@@ -182,28 +529,79 @@ def extract_archive_info(archive_path):
             'has_more': False
         }
 
-def extract_archive_to_temp(archive_path, extract_path=None):
-    """解压压缩包到临时目录"""
+def extract_archive_to_temp(archive_path, extract_path=None, progress=None):
+    """解压压缩包到临时目录，通过 progress 报告进度"""
     try:
         if extract_path is None:
             extract_path = tempfile.mkdtemp()
         
-        file_ext = os.path.splitext(archive_path)[1].lower()
-        
-        if file_ext == '.zip':
-            with zipfile.ZipFile(archive_path, 'r') as zip_file:
-                zip_file.extractall(extract_path)
-        elif file_ext == '.rar':
-            with rarfile.RarFile(archive_path, 'r') as rar_file:
-                rar_file.extractall(extract_path)
-        else:
-            raise ValueError(f"Unsupported archive type: {file_ext}")
+        archives.extract(
+            archive_path,
+            extract_path,
+            progress=progress,
+            max_total_size=EXTRACT_MAX_TOTAL_SIZE,
+            max_members=EXTRACT_MAX_MEMBERS,
+            workers=EXTRACT_THREADS
+        )
         
         return extract_path
     except Exception as e:
         logger.error(f"Error extracting archive: {str(e)}")
         raise
 
+def send_stored_file(full_path, mimetype=None, as_attachment=False):
+    """发送磁盘文件，支持 Range 分段请求和 ETag / Last-Modified 条件请求
+
+    文件体通过 wsgi.file_wrapper（gunicorn 下为 sendfile）直接从磁盘发送，不读入内存；
+    有元数据记录且大小一致时使用上传时计算的 SHA-256 作为 ETag，否则由 mtime 和大小生成。
+    文本类文件按 Accept-Encoding 发送 gzip / br 压缩版本，ETag 附带编码后缀以区分不同表示。
+    """
+    stat = os.stat(full_path)
+    record = metadata_store.find_by_file_path(full_path)
+    if record and record.get('file_size') == stat.st_size:
+        etag = record.get('sha256') or f"{record['uuid']}-{stat.st_size}"
+    else:
+        etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    
+    compressible = not as_attachment and is_compressible(full_path)
+    encoding, send_path = None, full_path
+    if compressible:
+        encoding, compressed_path = compression_cache.lookup(full_path, request.headers.get('Accept-Encoding'))
+        if encoding:
+            send_path = compressed_path
+            etag = f"{etag}-{encoding}"
+    
+    response = send_file(
+        send_path,
+        mimetype=mimetype or send_file_mimetype(full_path),
+        as_attachment=as_attachment,
+        download_name=os.path.basename(full_path),
+        conditional=True,
+        etag=etag,
+        last_modified=stat.st_mtime
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    return response
+
+# 大文本按行读取窗口时使用的行偏移索引，保存在 uploads/.lineindex/
+line_index_cache = LineIndexCache(UPLOAD_FOLDER, os.path.join(UPLOAD_FOLDER, '.lineindex'))
+
+# 单次窗口读取的上限
+MAX_TEXT_WINDOW_LINES = int(os.environ.get('MAX_TEXT_WINDOW_LINES', 5000))
+MAX_TEXT_WINDOW_BYTES = int(os.environ.get('MAX_TEXT_WINDOW_BYTES', 1024 * 1024))
+
+def text_preview_response(full_path):
+    """流式返回文本文件的 HTML 预览页，逐块转义输出，不把整个文件读入内存"""
+    logger.info(f"Streaming text preview: {full_path}")
+    return Response(stream_text_preview(full_path), content_type='text/html; charset=utf-8')
+
+def send_file_mimetype(path):
+    """按原文件名推断 MIME 类型（发送压缩版本时不能按 .gz 推断）"""
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
 @app.route('/')
 def index():
     """首页 - 重定向到静态页面"""
@@ -233,57 +631,189 @@ def direct_access_reports(file_path):
         
         if file_ext in ['.html', '.htm']:
             try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                logger.info(f"Successfully served HTML file: {full_path}")
-                return content, 200, {'Content-Type': 'text/html; charset=utf-8'}
+                logger.info(f"Serving HTML file: {full_path}")
+                return send_stored_file(full_path, mimetype='text/html')
             except Exception as e:
                 logger.error(f"Error reading HTML file: {str(e)}")
                 return jsonify({'error': f'Error reading file: {str(e)}'}), 500
         elif file_ext == '.txt':
-            try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                # 将文本内容包装在HTML中
-                html_content = f"""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <meta charset="utf-8">
-                    <title>文本预览 - {os.path.basename(full_path)}</title>
-                    <style>
-                        body {{ font-family: 'Courier New', monospace; padding: 20px; background: #f5f5f5; }}
-                        .container {{ background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                        pre {{ white-space: pre-wrap; word-wrap: break-word; margin: 0; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <h2>文件: {os.path.basename(full_path)}</h2>
-                        <pre>{content}</pre>
-                    </div>
-                </body>
-                </html>
-                """
-                logger.info(f"Successfully served text file: {full_path}")
-                return html_content, 200, {'Content-Type': 'text/html; charset=utf-8'}
-            except Exception as e:
-                logger.error(f"Error reading text file: {str(e)}")
-                return jsonify({'error': f'Error reading file: {str(e)}'}), 500
+            return text_preview_response(full_path)
         else:
             # 对于其他文件类型，提供下载
             logger.info(f"Providing download for file: {full_path}")
-            return send_file(full_path, as_attachment=True)
+            return send_stored_file(full_path, as_attachment=True)
         
     except Exception as e:
         logger.error(f"Direct access error: {str(e)}")
         return jsonify({'error': f'Access failed: {str(e)}'}), 500
 
+@app.route('/text/<path:file_path>', methods=['GET'])
+def read_text_window(file_path):
+    """按行或按字节读取文本文件的一个窗口
+
+    参数:
+        unit: lines（默认）或 bytes
+        head: 读取开头 N 行 / N 字节
+        tail: 读取末尾 N 行 / N 字节
+        offset + length: 从 offset 开始读取 length 行 / 字节（行号从 0 开始）
+    """
+    try:
+        full_path = os.path.join(UPLOAD_FOLDER, file_path)
+        
+        # 安全检查：确保文件路径在允许的目录内
+        if not os.path.abspath(full_path).startswith(os.path.abspath(UPLOAD_FOLDER)):
+            return jsonify({'error': 'Access denied'}), 403
+        
+        if not os.path.isfile(full_path):
+            return jsonify({'error': 'File not found'}), 404
+        
+        unit = request.args.get('unit', 'lines')
+        if unit not in ('lines', 'bytes'):
+            return jsonify({'error': 'unit must be lines or bytes'}), 400
+        max_length = MAX_TEXT_WINDOW_LINES if unit == 'lines' else MAX_TEXT_WINDOW_BYTES
+        
+        try:
+            if 'head' in request.args:
+                offset, length = 0, int(request.args['head'])
+            elif 'tail' in request.args:
+                length = int(request.args['tail'])
+                # 先按窗口上限截断，保证返回的是最后 N 行 / 字节
+                offset = -min(length, max_length)
+            else:
+                offset = int(request.args.get('offset', 0))
+                length = int(request.args.get('length', 200 if unit == 'lines' else 64 * 1024))
+        except ValueError:
+            return jsonify({'error': 'head, tail, offset and length must be integers'}), 400
+        if length < 0:
+            return jsonify({'error': 'length must not be negative'}), 400
+        length = min(length, max_length)
+        
+        if unit == 'bytes':
+            window = read_byte_window(full_path, offset, length)
+            window['unit'] = 'bytes'
+            return jsonify(window), 200
+        
+        index = line_index_cache.get(full_path)
+        if offset < 0:
+            offset = max(index.total_lines + offset, 0)
+        lines, truncated = index.read_lines(full_path, offset, length)
+        return jsonify({
+            'unit': 'lines',
+            'size': index.size,
+            'total_lines': index.total_lines,
+            'offset': offset,
+            'length': len(lines),
+            'next_offset': offset + len(lines),
+            'eof': offset + len(lines) >= index.total_lines,
+            'lines': lines,
+            'truncated_lines': truncated
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Text window error: {str(e)}")
+        return jsonify({'error': f'Read failed: {str(e)}'}), 500
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
     return jsonify({'status': 'healthy', 'message': 'File upload service is running'})
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 指标"""
+    rendered = metrics.render()
+    if rendered is None:
+        return jsonify({'error': 'prometheus_client is not installed'}), 503
+    body, content_type = rendered
+    return Response(body, content_type=content_type)
+
+def schedule_archive_listing(file_uuid, file_path, listing_key):
+    """后台生成压缩包清单并把摘要写回元数据记录"""
+    def task():
+        try:
+            listing = get_archive_listing(file_path, listing_key)
+            record = metadata_store.update(file_uuid, {
+                'archive_info': archives.listing_summary(listing),
+                'listing_key': listing_key
+            })
+            if record and search_index is not None:
+                search_index.index_record(record, UPLOAD_FOLDER, listing, force=True)
+        except Exception as e:
+            logger.warning(f"Failed to build archive listing for {file_path}: {str(e)}")
+    background_executor.submit(task)
+
+def prepare_uploaded_file(original_filename, safe_filename, relative_path, date_str, file_path, file_size, file_sha256):
+    """文件落盘后去重、生成压缩包清单并构建元数据记录（尚未写入存储）"""
+    deduplicated = False
+    if DEDUP_STORAGE and file_sha256:
+        try:
+            deduplicated = deduplicate_file(file_path, file_sha256)
+        except OSError as e:
+            # 文件系统不支持硬链接时保留普通文件
+            logger.warning(f"Deduplication skipped for {file_path}: {str(e)}")
+    
+    # 如果是压缩包，生成成员清单并随元数据记录保存摘要
+    archive_info = None
+    extra = None
+    listing = None
+    listing_key = file_sha256 or None
+    kind = archives.archive_type(file_path) if is_archive_file(safe_filename) else None
+    if kind and kind != 'tar' and listing_key:
+        try:
+            listing = get_archive_listing(file_path, listing_key)
+            archive_info = archive_info_from_listing(listing)
+            extra = {'archive_info': archives.listing_summary(listing), 'listing_key': listing_key}
+            logger.info(f"Archive info extracted: {extra['archive_info']}")
+        except Exception as e:
+            logger.warning(f"Failed to extract archive info: {str(e)}")
+    
+    return {
+        'file_info': new_file_info(safe_filename, relative_path, date_str, file_path, file_size, file_sha256, extra),
+        'original_filename': original_filename,
+        'deduplicated': deduplicated,
+        'archive_info': archive_info,
+        'listing': listing,
+        'listing_key': listing_key,
+        'kind': kind
+    }
+
+def finish_uploaded_file(uploaded):
+    """元数据写入后安排后台处理（预压缩、检索索引、tar 清单），返回上传接口的响应数据"""
+    file_info = uploaded['file_info']
+    file_path = file_info['file_path']
+    schedule_precompress(file_path)
+    schedule_search_index(file_info, uploaded['listing'])
+    
+    if uploaded['kind'] == 'tar' and uploaded['listing_key']:
+        # 压缩的 tar 需要完整解压一遍才能列出成员，放到后台生成
+        schedule_archive_listing(file_info['uuid'], file_path, uploaded['listing_key'])
+    
+    logger.info(f"File uploaded successfully: {file_info}")
+    
+    relative_path, date_str, safe_filename = file_info['relative_path'], file_info['date'], file_info['filename']
+    response_data = {
+        'message': 'File uploaded successfully',
+        'file_info': file_info,
+        'original_filename': uploaded['original_filename'],
+        'saved_filename': safe_filename,
+        'full_path': f"{relative_path}/{date_str}/{safe_filename}" if relative_path else f"{date_str}/{safe_filename}"
+    }
+    
+    if uploaded['archive_info']:
+        response_data['archive_info'] = uploaded['archive_info']
+    
+    if uploaded['deduplicated']:
+        response_data['deduplicated'] = True
+    
+    return response_data
+
+def register_uploaded_file(original_filename, safe_filename, relative_path, date_str, file_path, file_size, file_sha256):
+    """文件落盘后登记元数据，返回上传接口的响应数据"""
+    uploaded = prepare_uploaded_file(original_filename, safe_filename, relative_path, date_str,
+                                     file_path, file_size, file_sha256)
+    metadata_store.insert(uploaded['file_info'])
+    return finish_uploaded_file(uploaded)
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """文件上传接口"""
@@ -328,40 +858,329 @@ def upload_file():
         target_dir = create_directory_structure(UPLOAD_FOLDER, relative_path, date_str)
         logger.info(f"Target directory created: {target_dir}")
         
-        # 保存文件
+        # 保存文件：请求体已流式写入临时文件，这里只需原子重命名
         file_path = os.path.join(target_dir, safe_filename)
-        file.save(file_path)
+        file_size, file_sha256 = save_uploaded_file(file, file_path)
+        
+        # 保存文件信息并构建响应
+        response_data = register_uploaded_file(original_filename, safe_filename, relative_path, date_str,
+                                               file_path, file_size, file_sha256)
         
-        # 保存文件信息
-        file_info = save_file_info(safe_filename, relative_path, date_str, file_path)
+        return jsonify(response_data), 200
         
-        # 如果是压缩包，提取压缩包信息
-        archive_info = None
-        if is_archive_file(safe_filename):
+    except RequestEntityTooLarge as e:
+        logger.warning(f"Upload rejected: {str(e)}")
+        return jsonify({'error': f'File too large, maximum size is {MAX_UPLOAD_SIZE} bytes'}), 413
+    except Exception as e:
+        logger.error(f"Upload error: {str(e)}")
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+
+# 批量上传请求体的总大小上限（单个文件仍受 MAX_UPLOAD_SIZE 限制），设为0不限制
+MAX_BATCH_UPLOAD_SIZE = int(os.environ.get('MAX_BATCH_UPLOAD_SIZE', 4 * 1024 * 1024 * 1024))
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """批量上传接口：一次请求上传多个文件，所有元数据记录在一次提交中写入"""
+    try:
+        request.max_content_length = MAX_BATCH_UPLOAD_SIZE or None
+        files = request.files.getlist('files')
+        if not files:
+            return jsonify({'error': 'No files provided'}), 400
+        
+        # 公共参数，manifest 中与 files 顺序一一对应的条目可以单独指定 filename / relative_path / date
+        default_path = request.form.get('relative_path', '')
+        default_date = request.form.get('date', '') or datetime.now().strftime('%Y-%m-%d')
+        manifest = json.loads(request.form['manifest']) if request.form.get('manifest') else [{}] * len(files)
+        if not isinstance(manifest, list) or len(manifest) != len(files) or \
+                not all(isinstance(entry, dict) for entry in manifest):
+            return jsonify({'error': 'manifest must be a list with one object per file'}), 400
+        
+        results = [None] * len(files)
+        pending = []
+        target_dirs = {}
+        target_paths = set()
+        for index, (file, entry) in enumerate(zip(files, manifest)):
+            original_filename = file.filename
+            filename = entry.get('filename') or original_filename
+            relative_path = entry.get('relative_path', default_path)
+            date_str = entry.get('date') or default_date
+            
+            if not filename or not allowed_file(filename):
+                results[index] = {'index': index, 'original_filename': original_filename, 'error': 'File type not allowed'}
+                continue
+            safe_filename = secure_filename(filename)
+            
+            # 每个目标目录只创建一次
+            if (relative_path, date_str) not in target_dirs:
+                target_dirs[(relative_path, date_str)] = create_directory_structure(UPLOAD_FOLDER, relative_path, date_str)
+            file_path = os.path.join(target_dirs[(relative_path, date_str)], safe_filename)
+            if file_path in target_paths:
+                results[index] = {'index': index, 'original_filename': original_filename, 'error': 'Duplicate target path in batch'}
+                continue
+            target_paths.add(file_path)
+            
             try:
-                archive_info = extract_archive_info(file_path)
-                logger.info(f"Archive info extracted: {archive_info}")
+                file_size, file_sha256 = save_uploaded_file(file, file_path)
+                pending.append((index, prepare_uploaded_file(original_filename, safe_filename, relative_path, date_str,
+                                                             file_path, file_size, file_sha256)))
             except Exception as e:
-                logger.warning(f"Failed to extract archive info: {str(e)}")
+                logger.error(f"Batch upload error for {original_filename}: {str(e)}")
+                results[index] = {'index': index, 'original_filename': original_filename, 'error': f'Upload failed: {str(e)}'}
         
-        logger.info(f"File uploaded successfully: {file_info}")
-        
-        response_data = {
-            'message': 'File uploaded successfully',
-            'file_info': file_info,
+        # 所有元数据记录在一次提交中写入，写入失败时删除本批已落盘的文件，避免留下无记录的文件
+        try:
+            metadata_store.insert_many(uploaded['file_info'] for _, uploaded in pending)
+        except Exception:
+            for _, uploaded in pending:
+                file_path = uploaded['file_info']['file_path']
+                try:
+                    os.remove(file_path)
+                except OSError as e:
+                    logger.warning(f"Failed to remove {file_path} after batch insert error: {str(e)}")
+            raise
+        for index, uploaded in pending:
+            results[index] = dict(finish_uploaded_file(uploaded), index=index)
+        
+        failed = len(files) - len(pending)
+        logger.info(f"Batch upload finished: {len(pending)} uploaded, {failed} failed")
+        return jsonify({
+            'message': 'Batch upload finished',
+            'uploaded': len(pending),
+            'failed': failed,
+            'results': results
+        }), 200 if not failed else (207 if pending else 400)
+        
+    except RequestEntityTooLarge as e:
+        logger.warning(f"Batch upload rejected: {str(e)}")
+        return jsonify({'error': f'Request too large: {str(e)}'}), 413
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Batch upload error: {str(e)}")
+        return jsonify({'error': f'Batch upload failed: {str(e)}'}), 500
+
+# 断点续传：未完成的分片上传保存在该目录，超过有效期未更新的会被后台清理
+PARTIAL_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, '.partial')
+os.makedirs(PARTIAL_UPLOAD_FOLDER, exist_ok=True)
+PARTIAL_UPLOAD_TTL = int(os.environ.get('PARTIAL_UPLOAD_TTL', 24 * 3600))
+# 断点续传单个文件的最大字节数，设为0不限制
+MAX_RESUMABLE_UPLOAD_SIZE = int(os.environ.get('MAX_RESUMABLE_UPLOAD_SIZE', 20 * 1024 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def partial_upload_paths(upload_id):
+    """返回分片上传的 (数据文件, 会话信息文件) 路径，upload_id 非法时返回 None"""
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id or ''):
+        return None
+    base = os.path.join(PARTIAL_UPLOAD_FOLDER, upload_id)
+    return base + '.part', base + '.json'
+
+def load_partial_upload(upload_id):
+    """读取分片上传会话及当前已接收的字节数，不存在返回 (None, 0)"""
+    paths = partial_upload_paths(upload_id)
+    if paths is None or not os.path.exists(paths[1]):
+        return None, 0
+    with open(paths[1], 'r', encoding='utf-8') as f:
+        session = json.load(f)
+    offset = os.path.getsize(paths[0]) if os.path.exists(paths[0]) else 0
+    return session, offset
+
+@contextmanager
+def locked_partial_upload(part_path):
+    """以排他 flock 打开分片数据文件（PUT 与 complete 共用），会话已完成或已放弃时返回 None
+
+    等待锁期间 complete 可能已把数据文件重命名为正式文件，因此取得锁后确认打开的仍是当前的分片文件。
+    """
+    try:
+        f = open(part_path, 'r+b')
+    except FileNotFoundError:
+        yield None
+        return
+    with f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            current = os.stat(part_path)
+        except FileNotFoundError:
+            current = None
+        if current is None or current.st_ino != os.fstat(f.fileno()).st_ino:
+            yield None
+        else:
+            yield f
+
+def cleanup_partial_uploads():
+    """删除超过有效期未更新的分片上传，返回删除的会话数"""
+    removed = 0
+    cutoff = time.time() - PARTIAL_UPLOAD_TTL
+    upload_ids = {os.path.splitext(name)[0] for name in os.listdir(PARTIAL_UPLOAD_FOLDER)}
+    for upload_id in upload_ids:
+        paths = partial_upload_paths(upload_id)
+        if paths is None:
+            continue
+        # 以会话中最近一次写入的时间判断是否过期
+        mtimes = [os.path.getmtime(path) for path in paths if os.path.exists(path)]
+        if mtimes and max(mtimes) < cutoff:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            removed += 1
+    if removed:
+        logger.info(f"Removed {removed} stale partial upload(s)")
+    return removed
+
+def run_partial_upload_gc(interval):
+    """后台定期清理过期的分片上传"""
+    while True:
+        try:
+            cleanup_partial_uploads()
+        except Exception as e:
+            logger.error(f"Partial upload cleanup error: {str(e)}")
+        time.sleep(interval)
+
+threading.Thread(target=run_partial_upload_gc, args=(max(PARTIAL_UPLOAD_TTL // 4, 60),),
+                 name='partial-upload-gc', daemon=True).start()
+
+@app.route('/upload/init', methods=['POST'])
+def init_resumable_upload():
+    """断点续传 - 创建上传会话，返回 upload_id"""
+    try:
+        data = request.get_json() or {}
+        original_filename = data.get('filename', '')
+        relative_path = data.get('relative_path', '')
+        date_str = data.get('date', '') or datetime.now().strftime('%Y-%m-%d')
+        total_size = data.get('total_size')
+        
+        if not original_filename:
+            return jsonify({'error': 'filename is required'}), 400
+        if not allowed_file(original_filename):
+            return jsonify({'error': 'File type not allowed'}), 400
+        if total_size is not None:
+            total_size = int(total_size)
+            if total_size < 0 or (MAX_RESUMABLE_UPLOAD_SIZE and total_size > MAX_RESUMABLE_UPLOAD_SIZE):
+                return jsonify({'error': f'File too large, maximum size is {MAX_RESUMABLE_UPLOAD_SIZE} bytes'}), 413
+        
+        upload_id = uuid.uuid4().hex
+        part_path, session_path = partial_upload_paths(upload_id)
+        session = {
+            'upload_id': upload_id,
             'original_filename': original_filename,
-            'saved_filename': safe_filename,
-            'full_path': f"{relative_path}/{date_str}/{safe_filename}" if relative_path else f"{date_str}/{safe_filename}"
+            'filename': secure_filename(original_filename),
+            'relative_path': relative_path,
+            'date': date_str,
+            'total_size': total_size,
+            'sha256': data.get('sha256'),
+            'created_time': datetime.now().isoformat()
         }
+        open(part_path, 'wb').close()
+        with open(session_path, 'w', encoding='utf-8') as f:
+            json.dump(session, f, ensure_ascii=False)
         
-        if archive_info:
-            response_data['archive_info'] = archive_info
+        logger.info(f"Resumable upload initiated: {session}")
+        return jsonify({'upload_id': upload_id, 'offset': 0, 'chunk_size': UPLOAD_CHUNK_SIZE * 8}), 200
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Init upload error: {str(e)}")
+        return jsonify({'error': f'Init upload failed: {str(e)}'}), 500
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def get_resumable_upload(upload_id):
+    """断点续传 - 查询已接收的字节数，用于断线后确定续传位置"""
+    session, offset = load_partial_upload(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'upload_id': upload_id, 'offset': offset, 'total_size': session.get('total_size')}), 200
+
+@app.route('/upload/<upload_id>', methods=['PUT'])
+def put_resumable_chunk(upload_id):
+    """断点续传 - 按偏移量追加分片，请求体为分片原始字节，参数 offset 必须等于已接收的字节数"""
+    try:
+        session, _ = load_partial_upload(upload_id)
+        if session is None:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        offset = int(request.args.get('offset', 0))
+        part_path, _ = partial_upload_paths(upload_id)
+        
+        # 同一会话的并发分片以及 complete 串行执行
+        with locked_partial_upload(part_path) as f:
+            if f is None:
+                return jsonify({'error': 'Upload not found'}), 404
+            current = f.seek(0, os.SEEK_END)
+            if offset != current:
+                return jsonify({'error': 'Offset mismatch', 'offset': current}), 409
+            
+            # 声明了 total_size（包括 0）时以其为上限，否则使用全局上限（0 表示不限制）
+            limit = session['total_size'] if session.get('total_size') is not None else (MAX_RESUMABLE_UPLOAD_SIZE or None)
+            for chunk in iter(lambda: request.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                if limit is not None and current + len(chunk) > limit:
+                    f.truncate(offset)
+                    return jsonify({'error': f'Chunk exceeds the declared size of {limit} bytes', 'offset': offset}), 413
+                f.write(chunk)
+                current += len(chunk)
+        
+        return jsonify({'upload_id': upload_id, 'offset': current}), 200
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Upload chunk error: {str(e)}")
+        return jsonify({'error': f'Upload chunk failed: {str(e)}'}), 500
+
+@app.route('/upload/<upload_id>/complete', methods=['POST'])
+def complete_resumable_upload(upload_id):
+    """断点续传 - 校验并合并到 relative_path/date/filename，登记元数据"""
+    try:
+        session, _ = load_partial_upload(upload_id)
+        if session is None:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        part_path, session_path = partial_upload_paths(upload_id)
+        relative_path = session['relative_path']
+        date_str = session['date']
+        safe_filename = session['filename']
+        
+        # 持有与 PUT 相同的锁完成校验和重命名，进行中的分片写入不会被截断或移走
+        with locked_partial_upload(part_path) as f:
+            if f is None:
+                return jsonify({'error': 'Upload not found'}), 404
+            offset = f.seek(0, os.SEEK_END)
+            total_size = session.get('total_size')
+            if total_size is not None and offset != total_size:
+                return jsonify({'error': 'Upload incomplete', 'offset': offset, 'total_size': total_size}), 409
+            
+            # 只使用根据实际收到的数据计算的 SHA-256，客户端声明的值仅用于校验
+            f.seek(0)
+            sha256 = hashlib.sha256()
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+            file_sha256 = sha256.hexdigest()
+            if session.get('sha256') and session['sha256'].lower() != file_sha256:
+                return jsonify({'error': 'Checksum mismatch', 'sha256': file_sha256}), 409
+            
+            target_dir = create_directory_structure(UPLOAD_FOLDER, relative_path, date_str)
+            file_path = os.path.join(target_dir, safe_filename)
+            
+            # 分片文件与目标位于同一文件系统，原子重命名即可完成合并
+            os.replace(part_path, file_path)
+            os.remove(session_path)
         
+        response_data = register_uploaded_file(session['original_filename'], safe_filename, relative_path,
+                                               date_str, file_path, offset, file_sha256)
         return jsonify(response_data), 200
-        
     except Exception as e:
-        logger.error(f"Upload error: {str(e)}")
-        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+        logger.error(f"Complete upload error: {str(e)}")
+        return jsonify({'error': f'Complete upload failed: {str(e)}'}), 500
+
+@app.route('/upload/<upload_id>', methods=['DELETE'])
+def abort_resumable_upload(upload_id):
+    """断点续传 - 放弃上传并删除已接收的数据"""
+    paths = partial_upload_paths(upload_id)
+    if paths is None or not os.path.exists(paths[1]):
+        return jsonify({'error': 'Upload not found'}), 404
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    return jsonify({'message': 'Upload aborted'}), 200
 
 @app.route('/query', methods=['GET'])
 def query_files():
@@ -385,71 +1204,31 @@ def query_files():
         if page_size < 1 or page_size > 100:  # 限制每页最大100条
             page_size = 20
         
-        # 线程安全地读取元数据
-        metadata = safe_read_metadata()
-        
-        # 计算24小时前的时间
-        now = datetime.now()
-        twenty_four_hours_ago = now - timedelta(hours=24)
-        
-        # 过滤文件
-        filtered_files = []
-        for file_info in metadata:
-            # 检查路径匹配
-            if relative_path and file_info['relative_path'] != relative_path:
-                continue
-            
-            # 检查日期匹配
-            if date_str and file_info['date'] != date_str:
-                continue
-            
-            # 检查文件是否仍然存在
-            if os.path.exists(file_info['file_path']):
-                file_info['exists'] = True
-                file_info['current_size'] = os.path.getsize(file_info['file_path'])
-            else:
-                file_info['exists'] = False
-                file_info['current_size'] = 0
-            
-            # 添加新文件标识（24小时内上传且未查看的文件）
-            try:
-                upload_time = datetime.fromisoformat(file_info['upload_time'].replace('Z', '+00:00'))
-                is_recently_uploaded = upload_time > twenty_four_hours_ago
-                is_viewed = file_info.get('viewed', False)
-                file_info['is_new'] = is_recently_uploaded and not is_viewed
-            except:
-                file_info['is_new'] = False
-            
-            filtered_files.append(file_info)
-        
-        # 排序
-        if sort_by in ['upload_time', 'filename', 'file_size', 'date']:
-            reverse = sort_order.lower() == 'desc'
-            if sort_by == 'upload_time':
-                filtered_files.sort(key=lambda x: x.get('upload_time', ''), reverse=reverse)
-            elif sort_by == 'filename':
-                filtered_files.sort(key=lambda x: x.get('filename', '').lower(), reverse=reverse)
-            elif sort_by == 'file_size':
-                filtered_files.sort(key=lambda x: x.get('file_size', 0), reverse=reverse)
-            elif sort_by == 'date':
-                filtered_files.sort(key=lambda x: x.get('date', ''), reverse=reverse)
-        
-        # 计算分页信息
-        total_count = len(filtered_files)
+        # 键集分页游标（可选），传入时忽略page参数
+        cursor = request.args.get('cursor', '')
+        
+        # 使用存储层维护的过滤和排序索引，只取出当前页
+        records, total_count, next_cursor = metadata_store.query_page(
+            relative_path, date_str,
+            sort_by=sort_by,
+            descending=sort_order.lower() == 'desc',
+            offset=(page - 1) * page_size,
+            limit=page_size,
+            cursor=cursor or None
+        )
         total_pages = (total_count + page_size - 1) // page_size  # 向上取整
         
-        # 分页切片
-        start_index = (page - 1) * page_size
-        end_index = start_index + page_size
-        paginated_files = filtered_files[start_index:end_index]
+        # 后续的逐条处理只针对当前页
+        paginated_files = [annotate_file_info(record) for record in records]
         
         # 构建分页信息
         pagination_info = {
             'page': page,
             'page_size': page_size,
             'total_pages': total_pages,
-            'has_next': page < total_pages,
-            'has_prev': page > 1
+            'has_next': next_cursor is not None if cursor else page < total_pages,
+            'has_prev': bool(cursor) or page > 1,
+            'next_cursor': next_cursor
         }
         
         return jsonify({
@@ -465,6 +1244,57 @@ def query_files():
         logger.error(f"Query error: {str(e)}")
         return jsonify({'error': f'Query failed: {str(e)}'}), 500
 
+@app.route('/search', methods=['GET'])
+def search_reports():
+    """全文检索接口：按文件名、压缩包成员名和报告内容检索"""
+    try:
+        if search_index is None:
+            return jsonify({'error': 'Search index is disabled'}), 503
+        
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'q is required'}), 400
+        
+        page = max(int(request.args.get('page', 1)), 1)
+        page_size = int(request.args.get('page_size', 20))
+        if page_size < 1 or page_size > 100:
+            page_size = 20
+        
+        started = time.time()
+        results, total_count, total_capped = search_index.search(
+            query,
+            relative_path=request.args.get('relative_path', ''),
+            date_from=request.args.get('date_from', ''),
+            date_to=request.args.get('date_to', ''),
+            kind=request.args.get('kind', ''),
+            offset=(page - 1) * page_size,
+            limit=page_size
+        )
+        for result in results:
+            prefix = '/extracted/' if result['kind'] == 'extracted' else '/reports/'
+            result['url'] = prefix + quote(result['path'])
+        total_pages = (total_count + page_size - 1) // page_size
+        
+        return jsonify({
+            'results': results,
+            'total_count': total_count,
+            'total_capped': total_capped,
+            'took_ms': round((time.time() - started) * 1000, 2),
+            'pagination': {
+                'page': page,
+                'page_size': page_size,
+                'total_pages': total_pages,
+                'has_next': page < total_pages,
+                'has_prev': page > 1
+            }
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Search error: {str(e)}")
+        return jsonify({'error': f'Search failed: {str(e)}'}), 500
+
 @app.route('/download/<path:file_path>', methods=['GET'])
 def download_file(file_path):
     """文件下载接口"""
@@ -482,20 +1312,62 @@ def download_file(file_path):
         # 检查是否为HTML文件，如果是则直接显示
         file_ext = os.path.splitext(full_path)[1].lower()
         if file_ext in ['.html', '.htm']:
-            try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                return content, 200, {'Content-Type': 'text/html; charset=utf-8'}
-            except Exception as e:
-                logger.error(f"Error reading HTML file: {str(e)}")
-                return send_file(full_path, as_attachment=True)
+            return send_stored_file(full_path, mimetype='text/html')
         
-        return send_file(full_path, as_attachment=True)
+        return send_stored_file(full_path, as_attachment=True)
         
     except Exception as e:
         logger.error(f"Download error: {str(e)}")
         return jsonify({'error': f'Download failed: {str(e)}'}), 500
 
+ZIP_DOWNLOAD_MODES = {'auto', 'deflate', 'stored'}
+
+@app.route('/download-zip', methods=['GET'])
+def download_zip():
+    """打包下载 relative_path（含子目录）及可选 date 下的所有文件，边压缩边发送"""
+    try:
+        relative_path = request.args.get('relative_path', '').strip('/')
+        date_str = request.args.get('date', '')
+        # auto: 文本类文件压缩，图片、压缩包等已压缩的文件直接存储；stored: 全部不压缩
+        mode = request.args.get('mode', 'auto')
+        if mode not in ZIP_DOWNLOAD_MODES:
+            return jsonify({'error': f'mode must be one of {sorted(ZIP_DOWNLOAD_MODES)}'}), 400
+        if not relative_path and not date_str:
+            return jsonify({'error': 'relative_path or date is required'}), 400
+        
+        records = [record for record in metadata_store.query_tree(relative_path, date_str) if record.get('exists', True)]
+        
+        members = []
+        seen_paths = set()
+        for record in records:
+            path, exists = file_reconciler.resolve_path(record)
+            if not exists or path in seen_paths:
+                continue
+            seen_paths.add(path)
+            # 成员名相对于请求的 relative_path
+            sub_path = record.get('relative_path', '')[len(relative_path):].strip('/')
+            arcname = '/'.join(part for part in (sub_path, record.get('date', ''), record.get('filename', '')) if part)
+            if mode == 'stored' or (mode == 'auto' and not is_compressible(path)):
+                compress_type = zipfile.ZIP_STORED
+            else:
+                compress_type = zipfile.ZIP_DEFLATED
+            members.append((arcname, path, compress_type))
+        
+        if not members:
+            return jsonify({'error': 'No files found'}), 404
+        
+        download_name = '_'.join(part for part in (relative_path.replace('/', '_'), date_str) if part) + '.zip'
+        logger.info(f"Streaming zip download: {download_name}, {len(members)} file(s), mode={mode}")
+        response = Response(archives.stream_zip(members), mimetype='application/zip', direct_passthrough=True)
+        response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        # 反向代理（nginx ingress）不缓冲，边生成边发送
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        logger.error(f"Zip download error: {str(e)}")
+        return jsonify({'error': f'Zip download failed: {str(e)}'}), 500
+
 @app.route('/preview/<path:file_path>', methods=['GET'])
 def preview_file(file_path):
     """文件预览接口"""
@@ -515,41 +1387,12 @@ def preview_file(file_path):
         
         if file_ext in ['.html', '.htm']:
             try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                return content, 200, {'Content-Type': 'text/html; charset=utf-8'}
+                return send_stored_file(full_path, mimetype='text/html')
             except Exception as e:
                 logger.error(f"Error reading HTML file: {str(e)}")
                 return jsonify({'error': f'Error reading file: {str(e)}'}), 500
         elif file_ext == '.txt':
-            try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                # 将文本内容包装在HTML中
-                html_content = f"""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <meta charset="utf-8">
-                    <title>文本预览 - {os.path.basename(full_path)}</title>
-                    <style>
-                        body {{ font-family: 'Courier New', monospace; padding: 20px; background: #f5f5f5; }}
-                        .container {{ background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                        pre {{ white-space: pre-wrap; word-wrap: break-word; margin: 0; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <h2>文件: {os.path.basename(full_path)}</h2>
-                        <pre>{content}</pre>
-                    </div>
-                </body>
-                </html>
-                """
-                return html_content, 200, {'Content-Type': 'text/html; charset=utf-8'}
-            except Exception as e:
-                logger.error(f"Error reading text file: {str(e)}")
-                return jsonify({'error': f'Error reading file: {str(e)}'}), 500
+            return text_preview_response(full_path)
         elif is_archive_file(os.path.basename(full_path)):
             # 压缩包预览
             try:
@@ -563,6 +1406,11 @@ def preview_file(file_path):
                 if archive_info.get('has_more', False):
                     file_list_html += '<li><em>... 还有更多文件</em></li>'
                 
+                # zip 报告可以不解压直接在线打开
+                open_report_html = ''
+                if archive_info.get('type') == 'zip':
+                    open_report_html = f'<a href="/archive/{file_path}/" class="download-btn">在线打开</a>'
+                
                 html_content = f"""
                 <!DOCTYPE html>
                 <html>
@@ -593,6 +1441,7 @@ def preview_file(file_path):
                             <ul>{file_list_html}</ul>
                         </div>
                         <a href="/download/{file_path}" class="download-btn">下载压缩包</a>
+                        {open_report_html}
                     </div>
                 </body>
                 </html>
@@ -608,9 +1457,56 @@ def preview_file(file_path):
         logger.error(f"Preview error: {str(e)}")
         return jsonify({'error': f'Preview failed: {str(e)}'}), 500
 
+def extraction_job_id(full_path):
+    """同一压缩包（路径、大小、修改时间均相同）的解压请求共用一个任务"""
+    stat = os.stat(full_path)
+    key = f"{os.path.relpath(full_path, UPLOAD_FOLDER)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return 'extract-' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+def run_extraction(full_path, extract_dir, progress):
+    """解压到临时目录后原子替换旧的解压目录，解压期间旧目录仍可访问"""
+    staging_dir = f"{extract_dir}.{uuid.uuid4().hex}.staging"
+    started = time.perf_counter()
+    try:
+        extract_archive_to_temp(full_path, staging_dir, progress)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        metrics.observe_extraction(time.perf_counter() - started, 'failed')
+        raise
+    metrics.observe_extraction(time.perf_counter() - started, 'done')
+    
+    trash_dir = None
+    if os.path.exists(extract_dir):
+        trash_dir = f"{extract_dir}.{uuid.uuid4().hex}.trash"
+        os.rename(extract_dir, trash_dir)
+    os.rename(staging_dir, extract_dir)
+    if trash_dir:
+        shutil.rmtree(trash_dir, ignore_errors=True)
+        compression_cache.remove_tree(extract_dir)
+        line_index_cache.remove_tree(extract_dir)
+    schedule_precompress(extract_dir)
+    record = metadata_store.find_by_file_path(full_path)
+    if record:
+        schedule_search_index(record, extract_dir=extract_dir)
+    
+    return {
+        'extract_dir': os.path.relpath(extract_dir, UPLOAD_FOLDER),
+        'total_files': progress.files_done,
+        'total_bytes': progress.bytes_done
+    }
+
+def job_response(job):
+    """任务状态的对外表示"""
+    data = {key: job.get(key) for key in (
+        'id', 'kind', 'status', 'files_done', 'bytes_done', 'total_files', 'total_bytes',
+        'result', 'error', 'created_at', 'updated_at'
+    )}
+    data['status_url'] = f"/jobs/{job['id']}"
+    return data
+
 @app.route('/extract/<path:file_path>', methods=['GET'])
 def extract_archive(file_path):
-    """压缩包解压接口"""
+    """压缩包解压接口：提交后台解压任务并立即返回任务ID"""
     try:
         # 构建完整文件路径
         full_path = os.path.join(UPLOAD_FOLDER, file_path)
@@ -626,44 +1522,168 @@ def extract_archive(file_path):
         if not is_archive_file(os.path.basename(full_path)):
             return jsonify({'error': 'File is not an archive'}), 400
         
-        # 创建解压目录
-        extract_dir = os.path.join(os.path.dirname(full_path), f"{os.path.splitext(os.path.basename(full_path))[0]}_extracted")
-        
-        # 如果目录已存在，先删除
-        if os.path.exists(extract_dir):
-            shutil.rmtree(extract_dir)
+        # 解压目录
+        extract_dir = extracted_dir_for(full_path)
         
-        # 解压文件
         try:
-            extract_archive_to_temp(full_path, extract_dir)
-            
-            # 获取解压后的文件列表
-            extracted_files = []
-            for root, dirs, files in os.walk(extract_dir):
-                for file in files:
-                    file_path_rel = os.path.relpath(os.path.join(root, file), extract_dir)
-                    file_full_path = os.path.join(root, file)
-                    extracted_files.append({
-                        'name': file_path_rel,
-                        'size': os.path.getsize(file_full_path),
-                        'path': file_path_rel
-                    })
-            
-            return jsonify({
-                'message': 'Archive extracted successfully',
-                'extract_dir': os.path.relpath(extract_dir, UPLOAD_FOLDER),
-                'files': extracted_files,
-                'total_files': len(extracted_files)
-            }), 200
-            
-        except Exception as e:
-            logger.error(f"Error extracting archive: {str(e)}")
-            return jsonify({'error': f'Failed to extract archive: {str(e)}'}), 500
+            job, created = job_manager.submit(
+                extraction_job_id(full_path),
+                'extract',
+                {'archive': file_path},
+                lambda progress: run_extraction(full_path, extract_dir, progress),
+                # 已完成的任务在解压目录仍存在时直接复用
+                reusable=lambda done_job: os.path.isdir(extract_dir)
+            )
+        except JobQueueFull as e:
+            return jsonify({'error': str(e)}), 503
+        
+        if created:
+            logger.info(f"Extraction job queued: {job['id']} for {full_path}")
+        
+        response = job_response(job)
+        response['message'] = 'Archive extracted successfully' if job['status'] == 'done' else 'Extraction job accepted'
+        return jsonify(response), 200 if job['status'] == 'done' else 202
         
     except Exception as e:
         logger.error(f"Extract error: {str(e)}")
         return jsonify({'error': f'Extract failed: {str(e)}'}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询后台任务状态和进度"""
+    try:
+        if not re.fullmatch(r'[A-Za-z0-9_-]+', job_id):
+            return jsonify({'error': 'Invalid job id'}), 400
+        
+        job = job_manager.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify(job_response(job)), 200
+    except Exception as e:
+        logger.error(f"Job query error: {str(e)}")
+        return jsonify({'error': f'Query failed: {str(e)}'}), 500
+
+# zip 中央目录索引缓存，用于直接从压缩包中发送成员；优先使用上传时保存的清单
+zip_index_cache = archives.ZipIndexCache(listing_loader=load_archive_listing)
+
+def split_archive_path(file_path):
+    """把 a/b/report.zip/css/app.css 拆分为压缩包路径和成员名"""
+    parts = file_path.split('/')
+    for i, part in enumerate(parts):
+        if part.lower().endswith('.zip'):
+            candidate = os.path.join(UPLOAD_FOLDER, *parts[:i + 1])
+            if os.path.isfile(candidate):
+                return '/'.join(parts[:i + 1]), '/'.join(parts[i + 1:])
+    return None, None
+
+def default_member(index):
+    """压缩包的默认页面：根目录的 index.html，否则取层级最浅的 index.html"""
+    candidates = [name for name in index.entries if name.rsplit('/', 1)[-1].lower() in ('index.html', 'index.htm')]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda name: (name.count('/'), len(name)))
+
+@app.route('/archive/<path:file_path>', methods=['GET'])
+def serve_archive_member(file_path):
+    """不解压，直接从 zip 压缩包中发送单个成员，如 /archive/a/2025-01-01/report.zip/index.html"""
+    try:
+        archive_rel, member_name = split_archive_path(file_path)
+        if archive_rel is None:
+            return jsonify({'error': 'Archive not found'}), 404
+        
+        full_path = os.path.join(UPLOAD_FOLDER, archive_rel)
+        
+        # 安全检查：确保文件路径在允许的目录内
+        if not os.path.abspath(full_path).startswith(os.path.abspath(UPLOAD_FOLDER)):
+            return jsonify({'error': 'Access denied'}), 403
+        
+        index = zip_index_cache.get(full_path)
+        
+        # 未指定成员或指向目录时跳转到默认页面，保证报告中的相对链接可以正确解析
+        if not member_name or member_name.endswith('/'):
+            target = member_name + 'index.html'
+            if index.get(target) is None:
+                target = default_member(index) if not member_name else None
+            if not target:
+                return jsonify({'error': 'No index.html in archive'}), 404
+            return redirect(f"/archive/{quote(archive_rel)}/{quote(target)}")
+        
+        entry = index.get(member_name)
+        if entry is None:
+            return jsonify({'error': 'Member not found in archive'}), 404
+        
+        # 成员内容由压缩包的修改时间和成员 CRC 唯一确定
+        accept_gzip = 'gzip' in parse_accept_encoding(request.headers.get('Accept-Encoding'))
+        gzip_wrapped = accept_gzip and entry.compress_type == zipfile.ZIP_DEFLATED
+        etag = f"{entry.crc:08x}-{entry.file_size:x}-{index.mtime_ns:x}" + ('-gzip' if gzip_wrapped else '')
+        last_modified = datetime.fromtimestamp(index.mtime_ns // 10**9, timezone.utc)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        data, length, encoding = archives.open_zip_member(index, entry, accept_gzip)
+        if isinstance(data, archives.BoundedFile):
+            data = wrap_file(request.environ, data)
+        
+        response = Response(data, mimetype=send_file_mimetype(member_name), direct_passthrough=True)
+        response.content_length = length
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if is_compressible(member_name):
+            response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        return response
+        
+    except (archives.ArchiveError, zipfile.BadZipFile) as e:
+        logger.error(f"Archive member error: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Archive member access error: {str(e)}")
+        return jsonify({'error': f'Access failed: {str(e)}'}), 500
+
+@app.route('/archive-members/<path:file_path>', methods=['GET'])
+def list_archive_members(file_path):
+    """分页列出压缩包成员（名称、大小、压缩后大小、CRC），参数 offset、limit、prefix"""
+    try:
+        full_path = os.path.join(UPLOAD_FOLDER, file_path)
+        
+        # 安全检查：确保文件路径在允许的目录内
+        if not os.path.abspath(full_path).startswith(os.path.abspath(UPLOAD_FOLDER)):
+            return jsonify({'error': 'Access denied'}), 403
+        
+        if not os.path.isfile(full_path):
+            return jsonify({'error': 'File not found'}), 404
+        
+        if archives.archive_type(full_path) is None:
+            return jsonify({'error': 'File is not an archive'}), 400
+        
+        try:
+            offset = max(int(request.args.get('offset', 0)), 0)
+            limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+        except ValueError:
+            return jsonify({'error': 'offset and limit must be integers'}), 400
+        prefix = request.args.get('prefix') or None
+        
+        listing = get_archive_listing(full_path)
+        total, members = archives.listing_page(listing, offset, limit, prefix)
+        return jsonify({
+            'type': listing['type'],
+            'members': members,
+            'pagination': {
+                'offset': offset,
+                'limit': limit,
+                'total': total,
+                'has_next': offset + len(members) < total
+            }
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Archive listing error: {str(e)}")
+        return jsonify({'error': f'Listing failed: {str(e)}'}), 500
+
 @app.route('/extracted/<path:file_path>', methods=['GET'])
 def access_extracted_file(file_path):
     """访问解压后的文件"""
@@ -683,44 +1703,15 @@ def access_extracted_file(file_path):
         
         if file_ext in ['.html', '.htm']:
             try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                return content, 200, {'Content-Type': 'text/html; charset=utf-8'}
+                return send_stored_file(full_path, mimetype='text/html')
             except Exception as e:
                 logger.error(f"Error reading HTML file: {str(e)}")
                 return jsonify({'error': f'Error reading file: {str(e)}'}), 500
         elif file_ext == '.txt':
-            try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                # 将文本内容包装在HTML中
-                html_content = f"""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <meta charset="utf-8">
-                    <title>文本预览 - {os.path.basename(full_path)}</title>
-                    <style>
-                        body {{ font-family: 'Courier New', monospace; padding: 20px; background: #f5f5f5; }}
-                        .container {{ background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                        pre {{ white-space: pre-wrap; word-wrap: break-word; margin: 0; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <h2>文件: {os.path.basename(full_path)}</h2>
-                        <pre>{content}</pre>
-                    </div>
-                </body>
-                </html>
-                """
-                return html_content, 200, {'Content-Type': 'text/html; charset=utf-8'}
-            except Exception as e:
-                logger.error(f"Error reading text file: {str(e)}")
-                return jsonify({'error': f'Error reading file: {str(e)}'}), 500
+            return text_preview_response(full_path)
         else:
             # 对于其他文件类型，提供下载
-            return send_file(full_path, as_attachment=True)
+            return send_stored_file(full_path, as_attachment=True)
         
     except Exception as e:
         logger.error(f"Access extracted file error: {str(e)}")
@@ -735,17 +1726,8 @@ def delete_file_api():
         if not file_uuid:
             return jsonify({'error': 'uuid is required'}), 400
         
-        # 线程安全地读取元数据
-        metadata = safe_read_metadata()
-        if metadata is None:
-            return jsonify({'error': 'Failed to read metadata'}), 500
-        
         # 查找要删除的文件记录
-        target_file = None
-        for item in metadata:
-            if item.get('uuid') == file_uuid:
-                target_file = item
-                break
+        target_file = metadata_store.get(file_uuid)
         
         if not target_file:
             return jsonify({'error': 'File not found in metadata'}), 404
@@ -758,59 +1740,105 @@ def delete_file_api():
         else:
             # 删除文件
             try:
-                os.remove(file_path)
+                remove_stored_file(target_file)
                 logger.info(f"File deleted successfully: {file_path}")
             except Exception as e:
                 logger.error(f"Error deleting file {file_path}: {str(e)}")
                 # 即使文件删除失败，也继续删除元数据记录
         
         # 更新元数据 - 使用UUID进行精确删除
-        original_count = len(metadata)
-        filtered_metadata = [item for item in metadata if item.get('uuid') != file_uuid]
-        
-        # 线程安全地保存更新后的元数据
-        if not safe_write_metadata(filtered_metadata):
-            return jsonify({'error': 'Failed to update metadata'}), 500
-        
-        deleted_count = original_count - len(filtered_metadata)
-        logger.info(f"Metadata updated: {original_count} -> {len(filtered_metadata)} records, deleted {deleted_count} record(s)")
+        if metadata_store.delete(file_uuid) is None:
+            logger.warning(f"Metadata record already removed: {file_uuid}")
+        else:
+            logger.info(f"Metadata record deleted: {file_uuid}")
         
         return jsonify({'message': 'File deleted successfully'}), 200
     except Exception as e:
         logger.error(f"Delete error: {str(e)}")
         return jsonify({'error': f'Delete failed: {str(e)}'}), 500
 
+# 批量删除时并行删除文件的线程数（所有请求共用）
+BULK_DELETE_WORKERS = int(os.environ.get('BULK_DELETE_WORKERS', 4))
+file_removal_executor = ThreadPoolExecutor(max_workers=BULK_DELETE_WORKERS, thread_name_prefix='file-removal')
+
+def resolve_bulk_targets(data):
+    """批量接口的目标记录：uuids 列表，或 relative_path / date 过滤条件，返回 (记录列表, 未找到的UUID)"""
+    file_uuids = data.get('uuids')
+    if file_uuids is not None:
+        if not isinstance(file_uuids, list) or not all(isinstance(u, str) for u in file_uuids):
+            raise ValueError('uuids must be a list of strings')
+        file_uuids = list(dict.fromkeys(file_uuids))
+        found = metadata_store.get_many(file_uuids)
+        return [found[u] for u in file_uuids if u in found], [u for u in file_uuids if u not in found]
+    
+    relative_path = data.get('relative_path', '')
+    date_str = data.get('date', '')
+    if not relative_path and not date_str:
+        raise ValueError('uuids or relative_path/date is required')
+    return list(metadata_store.query(relative_path, date_str)), []
+
+@app.route('/delete/batch', methods=['POST'])
+def delete_files_batch():
+    """批量删除接口：文件在有界线程池中并行删除，元数据在一次提交中删除"""
+    try:
+        data = request.get_json() or {}
+        records, not_found = resolve_bulk_targets(data)
+        remove_extracted = bool(data.get('remove_extracted', False))
+        
+        def remove(record):
+            try:
+                remove_stored_file(record, remove_extracted)
+                return None
+            except Exception as e:
+                logger.error(f"Error deleting file {record.get('file_path')}: {str(e)}")
+                # 与单个删除一致：文件删除失败也删除元数据记录
+                return {'uuid': record['uuid'], 'error': str(e)}
+        
+        file_errors = [error for error in file_removal_executor.map(remove, records) if error]
+        removed = metadata_store.delete_many(record['uuid'] for record in records)
+        logger.info(f"Batch delete: {len(removed)} record(s) deleted, {len(file_errors)} file error(s)")
+        
+        return jsonify({
+            'message': 'Files deleted successfully',
+            'deleted': len(removed),
+            'not_found': not_found,
+            'file_errors': file_errors
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Batch delete error: {str(e)}")
+        return jsonify({'error': f'Batch delete failed: {str(e)}'}), 500
+
 @app.route('/directory-stats', methods=['GET'])
 def get_directory_stats():
-    """获取目录结构统计信息 - 不进行分页"""
+    """获取目录结构统计信息 - 不进行分页
+
+    可选参数 relative_path 作为前缀，只返回该路径及其子路径，便于前端按需加载目录树。
+    """
     try:
-        # 线程安全地读取元数据
-        metadata = safe_read_metadata()
+        prefix = request.args.get('relative_path', '').strip('/')
+        
+        # 读取增量维护的汇总数据，无需遍历全部元数据
+        stats = metadata_store.directory_stats(prefix)
         
         # 按路径和日期分组统计
         directory_stats = {}
+        directory_sizes = {}
         total_files = 0
+        total_bytes = 0
         
-        for file_info in metadata:
-            # 检查文件是否仍然存在
-            if not os.path.exists(file_info['file_path']):
-                continue
-            
-            relative_path = file_info.get('relative_path', '根目录')
-            date_str = file_info.get('date', '')
-            
-            if relative_path not in directory_stats:
-                directory_stats[relative_path] = {}
-            
-            if date_str not in directory_stats[relative_path]:
-                directory_stats[relative_path][date_str] = 0
-            
-            directory_stats[relative_path][date_str] += 1
-            total_files += 1
+        for relative_path, by_date in stats.items():
+            directory_stats[relative_path] = {date_str: counts[0] for date_str, counts in by_date.items()}
+            directory_sizes[relative_path] = {date_str: counts[1] for date_str, counts in by_date.items()}
+            total_files += sum(counts[0] for counts in by_date.values())
+            total_bytes += sum(counts[1] for counts in by_date.values())
         
         return jsonify({
             'directories': directory_stats,
-            'total_files': total_files
+            'directory_sizes': directory_sizes,
+            'total_files': total_files,
+            'total_bytes': total_bytes
         }), 200
         
     except Exception as e:
@@ -827,30 +1855,40 @@ def mark_file_viewed():
         if not file_uuid:
             return jsonify({'error': 'Missing file UUID'}), 400
         
-        # 线程安全地读取元数据
-        metadata = safe_read_metadata()
-        
-        # 查找并更新文件
-        file_found = False
-        for file_info in metadata:
-            if file_info.get('uuid') == file_uuid:
-                file_info['viewed'] = True
-                file_info['viewed_time'] = datetime.now().isoformat()
-                file_found = True
-                break
+        # 按UUID更新单条记录
+        updated = metadata_store.update(file_uuid, {
+            'viewed': True,
+            'viewed_time': datetime.now().isoformat()
+        })
         
-        if not file_found:
+        if updated is None:
             return jsonify({'error': 'File not found'}), 404
         
-        # 线程安全地保存更新后的元数据
-        if not safe_write_metadata(metadata):
-            return jsonify({'error': 'Failed to update metadata'}), 500
-        
         return jsonify({'message': 'File marked as viewed successfully'}), 200
         
     except Exception as e:
         logger.error(f"Mark viewed error: {str(e)}")
         return jsonify({'error': f'Failed to mark file as viewed: {str(e)}'}), 500
 
+@app.route('/mark-viewed/batch', methods=['POST'])
+def mark_files_viewed_batch():
+    """批量标记文件为已查看，所有记录在一次提交中更新"""
+    try:
+        data = request.get_json() or {}
+        records, not_found = resolve_bulk_targets(data)
+        changes = {'viewed': True, 'viewed_time': datetime.now().isoformat()}
+        updated = metadata_store.update_many({record['uuid']: changes for record in records})
+        
+        return jsonify({
+            'message': 'Files marked as viewed successfully',
+            'updated': updated,
+            'not_found': not_found
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Batch mark viewed error: {str(e)}")
+        return jsonify({'error': f'Failed to mark files as viewed: {str(e)}'}), 500
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=False) 
\ No newline at end of file
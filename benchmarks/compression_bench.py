@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+报告压缩传输基准测试
+生成一份模拟 pytest-html / Allure 风格的 HTML 报告并上传，分别以 identity、gzip、br
+请求 /reports/<path>，对比传输字节数和 p50 / p95 延迟，并对比冷缓存（即时压缩）与预压缩命中。
+
+用法:
+    python benchmarks/compression_bench.py --rows 20000 --requests 200
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import random
+import argparse
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(upload_folder):
+    os.environ['UPLOAD_FOLDER'] = upload_folder
+    os.environ['FILE_STATE_RECONCILE_INTERVAL'] = '0'
+    sys.path.insert(0, ROOT_DIR)
+    import logging
+    logging.disable(logging.INFO)
+    import app as app_module
+    return app_module
+
+
+def build_report(rows):
+    """生成带表格、日志片段和内联样式的 HTML 报告"""
+    rng = random.Random(42)
+    outcomes = ['passed', 'failed', 'skipped', 'error']
+    lines = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>Test Report</title>',
+             '<style>table{border-collapse:collapse}td{padding:2px 6px}.passed{color:green}'
+             '.failed{color:red}</style></head><body><h1>Test Report</h1><table>']
+    for i in range(rows):
+        outcome = rng.choice(outcomes)
+        lines.append(
+            f'<tr class="{outcome}"><td>tests/test_module_{i % 50}.py::test_case_{i}</td>'
+            f'<td>{outcome}</td><td>{rng.random() * 3:.3f}s</td>'
+            f'<td><div class="log">INFO request id={rng.getrandbits(32):08x} status=200</div></td></tr>'
+        )
+    lines.append('</table></body></html>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def measure(client, url, accept_encoding, count):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    latencies = []
+    body_size = 0
+    encoding = None
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        data = response.get_data()
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+        body_size = len(data)
+        encoding = response.headers.get('Content-Encoding', 'identity')
+    return {
+        'accept_encoding': accept_encoding or 'identity',
+        'content_encoding': encoding,
+        'bytes_on_wire': body_size,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='报告压缩传输基准测试')
+    parser.add_argument('--rows', type=int, default=20000, help='报告表格行数')
+    parser.add_argument('--requests', type=int, default=200, help='每种编码的请求次数')
+    args = parser.parse_args()
+
+    upload_folder = tempfile.mkdtemp(prefix='compression_bench_')
+    app_module = load_app(upload_folder)
+    client = app_module.app.test_client()
+    report = build_report(args.rows)
+
+    def upload(name):
+        response = client.post('/upload', data={
+            'file': (io.BytesIO(report), name),
+            'relative_path': 'bench',
+            'date': '2025-01-01',
+        })
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return f"/reports/bench/2025-01-01/{name}"
+
+    # 冷缓存：直接落盘、未经过上传预压缩的文件，第一次请求需要即时压缩
+    report_dir = os.path.join(upload_folder, 'bench', '2025-01-01')
+    os.makedirs(report_dir, exist_ok=True)
+    with open(os.path.join(report_dir, 'cold.html'), 'wb') as f:
+        f.write(report)
+    start = time.perf_counter()
+    client.get('/reports/bench/2025-01-01/cold.html', headers={'Accept-Encoding': 'gzip'}).get_data()
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    # 预压缩命中
+    url = upload('report.html')
+    app_module.compression_cache.precompress(os.path.join(report_dir, 'report.html'))
+
+    results = [measure(client, url, encoding, args.requests) for encoding in (None, 'gzip', 'br')]
+    print(json.dumps({
+        'report_bytes': len(report),
+        'requests_per_encoding': args.requests,
+        'cold_on_the_fly_gzip_ms': round(cold_ms, 3),
+        'results': results,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
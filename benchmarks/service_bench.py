@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+服务接口负载基准测试
+为每个数据规模生成合成的元数据存储（1k / 100k / 1M 条记录）和真实的上传目录树（HTML 报告、
+zip 压缩包），按配置的并发数压测 /upload、/query（首页和深页，每个排序字段，偏移和游标分页）、
+/directory-stats、/reports/<path> 和 /extract，输出吞吐量和 p50 / p95 / p99 延迟的 JSON，
+便于在版本之间对比。
+
+默认在独立进程中加载 app 并通过 test_client 调用（每个数据规模一个进程，互不影响）；
+指定 --url 时改为通过 HTTP 压测已启动的服务，此时服务与本脚本需要使用同一个上传目录：
+
+    python benchmarks/service_bench.py --records 1k 100k 1m --backend sqlite --concurrency 8 --output new.json
+
+    python benchmarks/service_bench.py --records 100k --upload-folder /data/bench --prepare-only
+    UPLOAD_FOLDER=/data/bench METADATA_BACKEND=sqlite gunicorn -w 4 -b 127.0.0.1:5001 app:app
+    python benchmarks/service_bench.py --upload-folder /data/bench --url http://127.0.0.1:5001
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import zipfile
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+SCENARIO_GROUPS = ('query', 'directory_stats', 'reports', 'extract', 'upload')
+SORT_KEYS = ('upload_time', 'filename', 'file_size', 'date')
+MANIFEST_PATH = os.path.join('.bench', 'manifest.json')
+GENERATE_CHUNK = 10000
+PAGE_SIZE = 100
+
+
+def parse_count(value):
+    """1000 / 1k / 100k / 1m"""
+    value = value.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * multiplier)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# 数据生成
+# ---------------------------------------------------------------------------
+
+def build_html(rng, rows):
+    """pytest-html 风格的报告"""
+    lines = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>Test Report</title></head>'
+             '<body><h1>Test Report</h1><table>']
+    for i in range(rows):
+        outcome = rng.choice(('passed', 'passed', 'passed', 'failed', 'skipped'))
+        lines.append(
+            f'<tr class="{outcome}"><td>tests/test_module_{i % 50}.py::test_case_{i}</td>'
+            f'<td>{outcome}</td><td>{rng.random() * 3:.3f}s</td>'
+            f'<td><div class="log">INFO request id={rng.getrandbits(32):08x} status=200</div></td></tr>'
+        )
+    lines.append('</table></body></html>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def build_zip(rng, members):
+    """Allure 风格的报告压缩包：一个入口页面加若干 JSON / JS / CSS 成员"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('index.html', build_html(rng, 200))
+        zf.writestr('styles.css', 'body{font-family:sans-serif}' * 200)
+        zf.writestr('app.js', 'function render(){return 1}\n' * 2000)
+        for i in range(members):
+            cases = [{'name': f'test_case_{i}_{j}', 'status': rng.choice(('passed', 'failed')),
+                      'duration': rng.randint(1, 5000)} for j in range(50)]
+            zf.writestr(f'data/test-cases/{i:04d}.json', json.dumps(cases))
+    return buffer.getvalue()
+
+
+class Layout:
+    """合成数据的目录布局：project/suite[/nightly] × 日期"""
+
+    def __init__(self, records, seed=42):
+        self.rng = random.Random(seed)
+        self.projects = max(2, min(50, records // 2000))
+        self.suites = 8
+        self.days = max(7, min(365, records // 500))
+        self.start = datetime(2025, 1, 1)
+        self.paths = []
+        for p in range(self.projects):
+            for s in range(self.suites):
+                self.paths.append(f'project{p:02d}/suite{s}')
+                self.paths.append(f'project{p:02d}/suite{s}/nightly')
+
+    def date(self, i):
+        return (self.start + timedelta(days=i % self.days)).strftime('%Y-%m-%d')
+
+    def upload_time(self, i):
+        return (self.start + timedelta(seconds=i * 7)).isoformat()
+
+
+def synthetic_records(upload_folder, layout, count):
+    """只有元数据、不落盘的记录（文件名、大小、路径分布接近真实的报告目录）"""
+    rng = layout.rng
+    extensions = ('.html', '.html', '.xml', '.log', '.zip', '.json')
+    for i in range(count):
+        relative_path = layout.paths[i % len(layout.paths)]
+        date_str = layout.date(i // len(layout.paths))
+        filename = f'report_{i:07d}{rng.choice(extensions)}'
+        size = int(rng.lognormvariate(11, 1.5))
+        yield {
+            'uuid': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            'filename': filename,
+            'relative_path': relative_path,
+            'date': date_str,
+            'file_path': os.path.join(upload_folder, relative_path, date_str, filename),
+            'upload_time': layout.upload_time(i),
+            'file_size': size,
+            'exists': True,
+            'current_size': size,
+        }
+
+
+def write_tree_file(upload_folder, relative_path, date_str, filename, data, upload_time):
+    directory = os.path.join(upload_folder, relative_path, date_str)
+    os.makedirs(directory, exist_ok=True)
+    file_path = os.path.join(directory, filename)
+    with open(file_path, 'wb') as f:
+        f.write(data)
+    return {
+        'uuid': str(uuid.uuid4()),
+        'filename': filename,
+        'relative_path': relative_path,
+        'date': date_str,
+        'file_path': file_path,
+        'upload_time': upload_time,
+        'file_size': len(data),
+        'exists': True,
+        'current_size': len(data),
+    }
+
+
+def prepare(upload_folder, backend, records, tree_files, archives, archive_members):
+    """生成元数据存储和上传目录树，返回写入上传目录的清单"""
+    from metadata_store import create_metadata_store
+
+    started = time.perf_counter()
+    layout = Layout(records)
+    rng = layout.rng
+    synthetic_count = max(0, records - tree_files - archives)
+
+    # 真实落盘的报告和压缩包，同样登记到元数据中
+    tree_records = []
+    reports = []
+    for i in range(tree_files):
+        relative_path = rng.choice(layout.paths)
+        date_str = layout.date(i)
+        record = write_tree_file(upload_folder, relative_path, date_str, f'tree_report_{i:04d}.html',
+                                 build_html(rng, rng.choice((100, 500, 2000, 8000))),
+                                 layout.upload_time(synthetic_count + i))
+        tree_records.append(record)
+        reports.append(f'{relative_path}/{date_str}/{record["filename"]}')
+    archive_paths = []
+    for i in range(archives):
+        relative_path = rng.choice(layout.paths)
+        date_str = layout.date(i)
+        record = write_tree_file(upload_folder, relative_path, date_str, f'tree_allure_{i:04d}.zip',
+                                 build_zip(rng, archive_members),
+                                 layout.upload_time(synthetic_count + tree_files + i))
+        tree_records.append(record)
+        archive_paths.append(f'{relative_path}/{date_str}/{record["filename"]}')
+
+    store = create_metadata_store(upload_folder, backend)
+    generated = synthetic_records(upload_folder, layout, synthetic_count)
+    if backend == 'sqlite':
+        # 分批提交，避免一次性在内存中构建全部记录
+        chunk = []
+        for record in generated:
+            chunk.append(record)
+            if len(chunk) >= GENERATE_CHUNK:
+                store.insert_many(chunk)
+                chunk = []
+        store.insert_many(chunk + tree_records)
+    else:
+        # json / journal 每次提交都会重写整个文件，只写一次
+        store.replace_all(list(generated) + tree_records)
+
+    manifest = {
+        'backend': backend,
+        'records': store.count(),
+        'reports': reports,
+        'archives': archive_paths,
+        'paths': layout.paths,
+        'generate_seconds': round(time.perf_counter() - started, 3),
+        'metadata_bytes': store.storage_size(),
+    }
+    manifest_file = os.path.join(upload_folder, MANIFEST_PATH)
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def deep_cursors(upload_folder, backend, total):
+    """每个排序字段在 90% 位置处的键集游标，与服务返回的 next_cursor 相同"""
+    from metadata_store import SORT_KEYS as STORE_SORT_KEYS, create_metadata_store, encode_cursor
+
+    store = create_metadata_store(upload_folder, backend)
+    cursors = {}
+    for key in SORT_KEYS:
+        page, _, _ = store.query_page(sort_by=key, descending=True, offset=int(total * 0.9), limit=1)
+        if page:
+            cursors[key] = encode_cursor(STORE_SORT_KEYS[key](page[0]), page[0]['uuid'])
+    return cursors
+
+
+# ---------------------------------------------------------------------------
+# 客户端
+# ---------------------------------------------------------------------------
+
+class InProcessClient:
+    """通过 Flask test_client 调用，每个线程一个 client"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def get(self, path, headers=None):
+        response = self._client().get(path, headers=headers or {})
+        return response.status_code, response.get_data()
+
+    def post(self, path, fields, files):
+        data = dict(fields)
+        for name, (filename, content) in files.items():
+            data[name] = (io.BytesIO(content), filename)
+        response = self._client().post(path, data=data)
+        return response.status_code, response.get_data()
+
+
+class HttpClient:
+    """通过 HTTP 调用已启动的服务"""
+
+    def __init__(self, base_url, timeout=300):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _send(self, request):
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def get(self, path, headers=None):
+        return self._send(urllib.request.Request(self.base_url + path, headers=headers or {}))
+
+    def post(self, path, fields, files):
+        boundary = uuid.uuid4().hex
+        body = io.BytesIO()
+        for name, value in fields.items():
+            body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for name, (filename, content) in files.items():
+            body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                       f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+            body.write(content)
+            body.write(b'\r\n')
+        body.write(f'--{boundary}--\r\n'.encode())
+        return self._send(urllib.request.Request(
+            self.base_url + path, data=body.getvalue(), method='POST',
+            headers={'Content-Type': f'multipart/form-data; boundary={boundary}'}))
+
+
+# ---------------------------------------------------------------------------
+# 压测
+# ---------------------------------------------------------------------------
+
+def run_scenario(request_fn, requests, concurrency, warmup):
+    """request_fn(i) 返回 HTTP 状态码；先顺序预热 warmup 次（不计入统计），再以 concurrency 并发执行"""
+    first_ms = None
+    for i in range(warmup):
+        start = time.perf_counter()
+        request_fn(-1 - i)
+        if first_ms is None:
+            first_ms = (time.perf_counter() - start) * 1000
+
+    latencies = [0.0] * requests
+    statuses = [0] * requests
+
+    def task(i):
+        start = time.perf_counter()
+        try:
+            statuses[i] = request_fn(i)
+        except Exception:
+            statuses[i] = -1
+        latencies[i] = (time.perf_counter() - start) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(task, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': sum(1 for status in statuses if not 200 <= status < 400),
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else None,
+        'first_ms': round(first_ms, 3) if first_ms is not None else None,
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies), 3),
+    }
+
+
+def get_status(client, path, headers=None):
+    return client.get(path, headers)[0]
+
+
+def wait_for_job(client, status, body, poll_interval, timeout):
+    """/extract 返回 202 时轮询任务直到结束，返回最终状态码"""
+    if status != 202:
+        return status
+    job_id = json.loads(body)['id']
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        status, body = client.get(f'/jobs/{job_id}')
+        job = json.loads(body)
+        if status != 200 or job['status'] == 'failed':
+            return 500
+        if job['status'] == 'done':
+            return 200
+    return 504
+
+
+def run_benchmarks(client, manifest, cursors, args, upload_folder):
+    rng = random.Random(7)
+    total = manifest['records']
+    last_page = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+    scenarios = {}
+
+    def bench(name, request_fn, requests=None, warmup=None):
+        scenarios[name] = run_scenario(request_fn, requests or args.requests, args.concurrency,
+                                       args.warmup if warmup is None else warmup)
+
+    if 'query' in args.scenarios:
+        for key in SORT_KEYS:
+            bench(f'query_{key}_first_page', lambda i, key=key: get_status(
+                client, f'/query?sort_by={key}&page=1&page_size={PAGE_SIZE}'))
+            # 90% 之后的随机深页
+            bench(f'query_{key}_deep_offset', lambda i, key=key: get_status(
+                client, f'/query?sort_by={key}&page={rng.randint(int(last_page * 0.9), last_page)}'
+                        f'&page_size={PAGE_SIZE}'))
+            if key in cursors:
+                bench(f'query_{key}_deep_cursor', lambda i, key=key: get_status(
+                    client, f'/query?sort_by={key}&page_size={PAGE_SIZE}&cursor={cursors[key]}'))
+        bench('query_relative_path', lambda i: get_status(
+            client, f'/query?relative_path={rng.choice(manifest["paths"])}&page_size={PAGE_SIZE}'))
+
+    if 'directory_stats' in args.scenarios:
+        bench('directory_stats', lambda i: get_status(client, '/directory-stats'))
+        bench('directory_stats_prefix', lambda i: get_status(
+            client, f'/directory-stats?relative_path={rng.choice(manifest["paths"]).split("/")[0]}'))
+
+    if 'reports' in args.scenarios and manifest['reports']:
+        bench('reports', lambda i: get_status(
+            client, f'/reports/{rng.choice(manifest["reports"])}', {'Accept-Encoding': 'gzip, br'}))
+        bench('reports_identity', lambda i: get_status(client, f'/reports/{rng.choice(manifest["reports"])}'))
+
+    if 'extract' in args.scenarios and manifest['archives']:
+        archives = manifest['archives']
+        # 删除上次运行留下的解压目录，保证每个压缩包都真正解压一次
+        for path in archives:
+            full_path = os.path.join(upload_folder, path)
+            shutil.rmtree(f'{os.path.splitext(full_path)[0]}_extracted', ignore_errors=True)
+
+        def extract(i):
+            status, body = client.get(f'/extract/{archives[i]}')
+            return wait_for_job(client, status, body, args.poll_interval, args.job_timeout)
+        bench('extract', extract, requests=len(archives), warmup=0)
+
+    if 'upload' in args.scenarios:
+        payload = build_html(random.Random(1), args.upload_rows)
+
+        def upload(i):
+            # 每次内容不同，避免命中去重
+            content = payload + f'<!-- {uuid.uuid4().hex} -->'.encode()
+            return client.post('/upload', {
+                'relative_path': f'bench-upload/w{i % 8}',
+                'date': '2025-06-01',
+            }, {'file': (f'upload_{uuid.uuid4().hex[:12]}.html', content)})[0]
+        bench('upload', upload, requests=args.upload_requests)
+
+    return scenarios
+
+
+def load_app(upload_folder, backend):
+    """在当前进程中加载 app；关闭后台巡检和保留策略，避免干扰测量"""
+    os.environ['UPLOAD_FOLDER'] = upload_folder
+    os.environ['METADATA_BACKEND'] = backend
+    os.environ.setdefault('FILE_STATE_RECONCILE_INTERVAL', '0')
+    os.environ.setdefault('RETENTION_INTERVAL', '0')
+    import logging
+    logging.disable(logging.INFO)
+    import app as app_module
+    return app_module
+
+
+def load_manifest(upload_folder):
+    with open(os.path.join(upload_folder, MANIFEST_PATH), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def bench_dataset(upload_folder, records, args):
+    """单个数据规模：生成数据（如需要）并压测，返回结果；在独立进程中执行"""
+    if records is None:
+        manifest = load_manifest(upload_folder)
+    else:
+        manifest = prepare(upload_folder, args.backend, records, args.tree_files, args.archives,
+                           args.archive_members)
+    result = {key: manifest[key] for key in ('backend', 'records', 'generate_seconds', 'metadata_bytes')}
+    if args.prepare_only:
+        result['upload_folder'] = upload_folder
+        return result
+
+    cursors = deep_cursors(upload_folder, manifest['backend'], manifest['records'])
+    if args.url:
+        client = HttpClient(args.url)
+    else:
+        client = InProcessClient(load_app(upload_folder, manifest['backend']).app)
+    result['scenarios'] = run_benchmarks(client, manifest, cursors, args, upload_folder)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='服务接口负载基准测试')
+    parser.add_argument('--records', nargs='+', default=['1k', '100k'],
+                        help='数据规模，可用 k / m 后缀，如 1k 100k 1m')
+    parser.add_argument('--backend', default=os.environ.get('METADATA_BACKEND', 'sqlite'), help='元数据存储后端')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIO_GROUPS), choices=SCENARIO_GROUPS)
+    parser.add_argument('--concurrency', type=int, default=8, help='并发请求数')
+    parser.add_argument('--requests', type=int, default=200, help='每个场景的请求数')
+    parser.add_argument('--upload-requests', type=int, default=100, help='上传场景的请求数')
+    parser.add_argument('--upload-rows', type=int, default=500, help='上传报告的表格行数')
+    parser.add_argument('--warmup', type=int, default=3, help='每个场景不计入统计的预热请求数')
+    parser.add_argument('--tree-files', type=int, default=200, help='真实落盘的 HTML 报告数')
+    parser.add_argument('--archives', type=int, default=16, help='真实落盘的 zip 压缩包数（即解压请求数）')
+    parser.add_argument('--archive-members', type=int, default=200, help='每个压缩包的数据文件数')
+    parser.add_argument('--poll-interval', type=float, default=0.02, help='轮询解压任务的间隔（秒）')
+    parser.add_argument('--job-timeout', type=float, default=600, help='单个解压任务的超时（秒）')
+    parser.add_argument('--upload-folder', help='数据目录，默认为每个规模创建临时目录；与 --url 一起使用时读取已生成的数据')
+    parser.add_argument('--prepare-only', action='store_true', help='只生成数据，不压测')
+    parser.add_argument('--url', help='压测已启动的服务，如 http://127.0.0.1:5001')
+    parser.add_argument('--output', help='结果写入文件，默认输出到标准输出')
+    args = parser.parse_args()
+
+    if args.url and not args.upload_folder:
+        parser.error('--url requires --upload-folder (the service\'s UPLOAD_FOLDER)')
+    if args.upload_folder and len(args.records) > 1 and not args.url:
+        parser.error('--upload-folder holds a single dataset; pass one --records value')
+
+    jobs = []
+    if args.url and not args.prepare_only:
+        # 数据已由 --prepare-only 生成，直接读取清单
+        jobs.append((args.upload_folder, None))
+    else:
+        for value in args.records:
+            records = parse_count(value)
+            folder = args.upload_folder or tempfile.mkdtemp(prefix=f'service_bench_{records}_')
+            jobs.append((folder, records))
+
+    # 每个数据规模在独立进程中加载 app，互不共享缓存
+    datasets = {}
+    ctx = multiprocessing.get_context('spawn')
+    for folder, records in jobs:
+        with ctx.Pool(1) as pool:
+            result = pool.apply(bench_dataset, (folder, records, args))
+        datasets[str(result['records'])] = result
+        if not args.upload_folder and not args.prepare_only:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    output = json.dumps({
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'target': args.url or 'in-process',
+        'config': {key: getattr(args, key) for key in (
+            'backend', 'concurrency', 'requests', 'upload_requests', 'warmup', 'tree_files', 'archives')},
+        'datasets': datasets,
+    }, indent=2, ensure_ascii=False, sort_keys=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
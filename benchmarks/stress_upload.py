@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+元数据并发写入压力测试
+模拟 gunicorn 多 worker：启动多个进程，每个进程各自加载 app 并通过 test_client
+并发上传文件，然后同时执行标记已查看与删除，最后校验元数据记录没有丢失。
+
+用法:
+    python benchmarks/stress_upload.py --processes 8 --uploads 400 --backend json
+"""
+
+import os
+import sys
+import io
+import time
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(upload_folder, backend):
+    """在当前进程中加载 app（每个进程拥有独立的锁和缓存，与 gunicorn worker 一致）"""
+    os.environ['UPLOAD_FOLDER'] = upload_folder
+    os.environ['METADATA_BACKEND'] = backend
+    sys.path.insert(0, ROOT_DIR)
+    import logging
+    logging.disable(logging.INFO)
+    import app as app_module
+    return app_module
+
+
+def worker(upload_folder, backend, worker_id, count, threads):
+    """单个 worker 进程：多线程上传 count 个文件，再对其中一半标记已查看、四分之一删除"""
+    app_module = load_app(upload_folder, backend)
+    client_local = app_module.app.test_client
+
+    def upload(i):
+        client = client_local()
+        response = client.post('/upload', data={
+            'file': (io.BytesIO(f'worker {worker_id} file {i}'.encode()), f'w{worker_id}_{i}.txt'),
+            'relative_path': f'stress/w{worker_id % 4}',
+            'date': '2025-01-01',
+        })
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return response.get_json()['file_info']['uuid']
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        uuids = list(pool.map(upload, range(count)))
+
+    deleted = uuids[:count // 4]
+    viewed = uuids[count // 4:count // 2]
+
+    def delete(file_uuid):
+        response = client_local().post('/delete', json={'uuid': file_uuid})
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    def mark_viewed(file_uuid):
+        response = client_local().post('/mark-viewed', json={'uuid': file_uuid})
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(delete, deleted))
+        list(pool.map(mark_viewed, viewed))
+
+    return uuids, deleted, viewed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='元数据并发写入压力测试')
+    parser.add_argument('--processes', type=int, default=8, help='模拟的 worker 进程数')
+    parser.add_argument('--uploads', type=int, default=400, help='上传总数')
+    parser.add_argument('--threads', type=int, default=4, help='每个进程的并发线程数')
+    parser.add_argument('--backend', default=os.environ.get('METADATA_BACKEND', 'json'), help='元数据存储后端')
+    args = parser.parse_args()
+
+    upload_folder = tempfile.mkdtemp(prefix='stress_upload_')
+    per_worker = args.uploads // args.processes
+
+    start = time.time()
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(args.processes) as pool:
+        results = pool.starmap(worker, [
+            (upload_folder, args.backend, worker_id, per_worker, args.threads)
+            for worker_id in range(args.processes)
+        ])
+    elapsed = time.time() - start
+
+    expected = set()
+    expected_viewed = set()
+    for uuids, deleted, viewed in results:
+        expected.update(set(uuids) - set(deleted))
+        expected_viewed.update(viewed)
+
+    app_module = load_app(upload_folder, args.backend)
+    records = app_module.metadata_store.load_all()
+    actual = {record['uuid'] for record in records}
+    actual_viewed = {record['uuid'] for record in records if record.get('viewed')}
+
+    total = per_worker * args.processes
+    print(f"后端: {args.backend}")
+    print(f"上传: {total} 个文件，{args.processes} 个进程，耗时 {elapsed:.2f}s ({total / elapsed:.1f} 次/秒)")
+    print(f"期望记录数: {len(expected)}，实际记录数: {len(records)}")
+    print(f"数据目录: {upload_folder}")
+
+    assert len(records) == len(actual), "存在重复的UUID记录"
+    assert actual == expected, f"记录丢失: {len(expected - actual)}，多余记录: {len(actual - expected)}"
+    assert actual_viewed == expected_viewed, f"已查看标记丢失: {len(expected_viewed - actual_viewed)}"
+    print("校验通过：没有记录丢失")
+
+
+if __name__ == '__main__':
+    main()
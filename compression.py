@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+报告压缩缓存
+HTML / 文本类报告在上传或解压后预先压缩为 gzip（安装了 brotli 时同时生成 br），
+压缩结果保存在 uploads/.compressed/ 下与原文件相同的相对路径中，请求时按
+Accept-Encoding 直接发送预压缩文件；未命中时即时压缩并写入缓存。
+缓存总大小超过上限时按最近访问时间淘汰。
+"""
+
+import os
+import gzip
+import shutil
+import logging
+import threading
+import time
+import uuid
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 值得压缩的文本类文件扩展名
+COMPRESSIBLE_EXTENSIONS = {'.html', '.htm', '.txt', '.log', '.css', '.js', '.json', '.svg', '.xml', '.csv'}
+
+# 支持的编码及缓存文件后缀，按优先级排列
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')] if brotli is not None else [('gzip', '.gz')]
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def is_compressible(path):
+    """是否为值得压缩的文本类文件"""
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，返回客户端接受的编码集合（忽略 q=0）"""
+    accepted = set()
+    for item in (header or '').split(','):
+        parts = item.strip().split(';')
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name)
+    return accepted
+
+
+class CompressionCache:
+    """预压缩文件缓存"""
+
+    def __init__(self, root_folder, cache_folder, max_bytes, max_file_size):
+        self.root_folder = os.path.abspath(root_folder)
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        # 超过该大小的文件不即时压缩，避免阻塞请求
+        self.max_file_size = max_file_size
+        self._lock = threading.Lock()
+
+    def _cache_path(self, source_path, suffix):
+        relative = os.path.relpath(os.path.abspath(source_path), self.root_folder)
+        return os.path.join(self.cache_folder, relative + suffix)
+
+    def _is_fresh(self, cache_path, source_stat):
+        """缓存文件的 mtime 与源文件一致时有效"""
+        try:
+            return os.stat(cache_path).st_mtime_ns == source_stat.st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+    def _compress(self, source_path, cache_path, encoding, source_stat, level):
+        """流式压缩到临时文件后原子替换，并把 mtime 设置为源文件的 mtime"""
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(source_path, 'rb') as src, open(temp_path, 'wb') as dst:
+                if encoding == 'gzip':
+                    with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=level, mtime=0) as gz:
+                        shutil.copyfileobj(src, gz, CHUNK_SIZE)
+                else:
+                    compressor = brotli.Compressor(quality=level)
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                        dst.write(compressor.process(chunk))
+                    dst.write(compressor.finish())
+            os.utime(temp_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+            os.replace(temp_path, cache_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def precompress(self, source_path):
+        """为文件生成所有支持编码的预压缩版本（上传、解压后在后台调用）"""
+        if not is_compressible(source_path):
+            return
+        source_stat = os.stat(source_path)
+        for encoding, suffix in ENCODINGS:
+            cache_path = self._cache_path(source_path, suffix)
+            if not self._is_fresh(cache_path, source_stat):
+                self._compress(source_path, cache_path, encoding, source_stat, 9)
+
+    def precompress_tree(self, directory):
+        """预压缩目录下所有文本类文件"""
+        for root, dirs, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if is_compressible(path):
+                    try:
+                        self.precompress(path)
+                    except Exception as e:
+                        logger.warning(f"Precompress failed for {path}: {str(e)}")
+
+    def lookup(self, source_path, accept_encoding):
+        """按 Accept-Encoding 返回 (编码, 压缩文件路径)，没有可用版本时返回 (None, None)
+
+        缓存未命中且文件不大时即时压缩 gzip 并写入缓存。
+        """
+        if not is_compressible(source_path):
+            return None, None
+        accepted = parse_accept_encoding(accept_encoding)
+        if not accepted:
+            return None, None
+
+        source_stat = os.stat(source_path)
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            cache_path = self._cache_path(source_path, suffix)
+            if self._is_fresh(cache_path, source_stat):
+                self._touch(cache_path, source_stat)
+                return encoding, cache_path
+
+        if 'gzip' in accepted and source_stat.st_size <= self.max_file_size:
+            cache_path = self._cache_path(source_path, '.gz')
+            try:
+                # 即时压缩使用较低级别，兼顾响应时间
+                self._compress(source_path, cache_path, 'gzip', source_stat, 6)
+                return 'gzip', cache_path
+            except Exception as e:
+                logger.warning(f"On-the-fly compression failed for {source_path}: {str(e)}")
+        return None, None
+
+    @staticmethod
+    def _touch(cache_path, source_stat):
+        """更新访问时间用于淘汰，mtime 保持与源文件一致"""
+        try:
+            os.utime(cache_path, ns=(time.time_ns(), source_stat.st_mtime_ns))
+        except OSError:
+            pass
+
+    def enforce_limit(self):
+        """缓存总大小超过上限时按访问时间淘汰最久未用的文件，返回淘汰数"""
+        if not self.max_bytes or not os.path.isdir(self.cache_folder):
+            return 0
+        with self._lock:
+            entries = []
+            total = 0
+            for root, dirs, files in os.walk(self.cache_folder):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_atime_ns, st.st_size, path))
+                    total += st.st_size
+            if total <= self.max_bytes:
+                return 0
+
+            removed = 0
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            logger.info(f"Compression cache trimmed: {removed} file(s) removed, {total} bytes remain")
+            return removed
+
+    def remove(self, source_path):
+        """源文件删除时一并删除其压缩版本"""
+        for suffix in ('.gz', '.br'):
+            try:
+                os.remove(self._cache_path(source_path, suffix))
+            except FileNotFoundError:
+                pass
+
+    def remove_tree(self, directory):
+        """源目录删除时一并删除其压缩版本目录"""
+        cache_dir = self._cache_path(directory, '')
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir, ignore_errors=True)
@@ -0,0 +1,26 @@
+"""
+gunicorn 配置
+命令行参数（--bind、--workers）优先；这里只定义多 worker 共享 Prometheus 指标目录所需的钩子
+"""
+
+import os
+import shutil
+
+
+def on_starting(server):
+    """主进程启动时清空上次运行遗留的指标文件"""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """worker 退出后标记其指标文件，Gauge 不再计入该进程"""
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+后台任务队列
+耗时操作（如压缩包解压）提交到有界线程池中执行，请求立即返回任务ID。
+任务状态保存在 uploads/.jobs/<job_id>.json，所有 gunicorn worker 都能查询；
+执行中的任务持有 <job_id>.lock 上的排他 flock，进程退出时锁自动释放，
+据此判断状态为 running 的任务是否已经中断。
+"""
+
+import os
+import json
+import time
+import uuid
+import fcntl
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# 进度写盘的最小间隔（秒）
+PROGRESS_WRITE_INTERVAL = 0.5
+
+
+class JobQueueFull(Exception):
+    """等待中的任务过多"""
+
+
+class JobProgress:
+    """传给任务函数的进度对象，累计已完成的文件数和字节数"""
+
+    def __init__(self, manager, job):
+        self._manager = manager
+        self._job = job
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def files_done(self):
+        return self._job['files_done']
+
+    @property
+    def bytes_done(self):
+        return self._job['bytes_done']
+
+    def set_total(self, files=None, bytes=None):
+        with self._lock:
+            if files is not None:
+                self._job['total_files'] = files
+            if bytes is not None:
+                self._job['total_bytes'] = bytes
+            self._flush(force=True)
+
+    def advance(self, files=0, bytes=0):
+        with self._lock:
+            self._job['files_done'] += files
+            self._job['bytes_done'] += bytes
+            self._flush()
+
+    def _flush(self, force=False):
+        now = time.time()
+        if force or now - self._last_write >= PROGRESS_WRITE_INTERVAL:
+            self._job['updated_at'] = now
+            self._manager._write(self._job)
+            self._last_write = now
+
+
+class JobManager:
+    """基于文件状态和文件锁的跨进程任务管理"""
+
+    def __init__(self, jobs_folder, max_workers=2, max_pending=32):
+        self.jobs_folder = jobs_folder
+        self.max_pending = max_pending
+        os.makedirs(jobs_folder, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    def _state_path(self, job_id):
+        return os.path.join(self.jobs_folder, f"{job_id}.json")
+
+    def _lock_path(self, job_id):
+        return os.path.join(self.jobs_folder, f"{job_id}.lock")
+
+    def _write(self, job):
+        path = self._state_path(job['id'])
+        temp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def _read(self, job_id):
+        try:
+            with open(self._state_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _try_lock(self, job_id):
+        """尝试获取任务锁，成功返回文件描述符，任务正在别处执行时返回 None"""
+        fd = os.open(self._lock_path(job_id), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+            return None
+
+    @staticmethod
+    def _release(fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def get(self, job_id):
+        """读取任务状态；执行者已退出的 queued / running 任务标记为 failed"""
+        job = self._read(job_id)
+        if job is None or job['status'] not in ACTIVE_STATUSES:
+            return job
+        fd = self._try_lock(job_id)
+        if fd is None:
+            return job
+        try:
+            job = self._read(job_id)
+            if job and job['status'] in ACTIVE_STATUSES:
+                job['status'] = 'failed'
+                job['error'] = 'Job interrupted'
+                job['updated_at'] = time.time()
+                self._write(job)
+            return job
+        finally:
+            self._release(fd)
+
+    def submit(self, job_id, kind, params, runner, reusable=None):
+        """提交任务并返回 (任务状态, 是否新建)
+
+        同一 job_id 正在执行时直接返回该任务；已完成且 reusable(job) 为真时复用结果；
+        否则重新执行。runner(progress) 的返回值保存在任务的 result 字段。
+        """
+        fd = self._try_lock(job_id)
+        if fd is None:
+            # 其他线程或 worker 正在执行
+            job = self._read(job_id)
+            return job or {'id': job_id, 'kind': kind, 'status': 'queued'}, False
+
+        try:
+            job = self._read(job_id)
+            if job and job['status'] == 'done' and (reusable is None or reusable(job)):
+                self._release(fd)
+                return job, False
+
+            with self._pending_lock:
+                if self._pending >= self.max_pending:
+                    raise JobQueueFull(f'Too many pending jobs ({self._pending})')
+                self._pending += 1
+
+            now = time.time()
+            job = {
+                'id': job_id,
+                'kind': kind,
+                'params': params,
+                'status': 'queued',
+                'files_done': 0,
+                'bytes_done': 0,
+                'total_files': None,
+                'total_bytes': None,
+                'result': None,
+                'error': None,
+                'created_at': now,
+                'updated_at': now,
+            }
+            self._write(job)
+            self._executor.submit(self._run, job, runner, fd)
+            return job, True
+        except Exception:
+            self._release(fd)
+            raise
+
+    def _run(self, job, runner, fd):
+        progress = JobProgress(self, job)
+        try:
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+            progress._flush(force=True)
+            result = runner(progress)
+            with progress._lock:
+                job['status'] = 'done'
+                job['result'] = result
+                job['finished_at'] = time.time()
+                progress._flush(force=True)
+            logger.info(f"Job {job['id']} ({job['kind']}) finished")
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['kind']}) failed: {str(e)}")
+            with progress._lock:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+                job['finished_at'] = time.time()
+                progress._flush(force=True)
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+            self._release(fd)
+
+    def cleanup(self, max_age):
+        """删除超过 max_age 秒未更新的已结束任务，返回删除数"""
+        removed = 0
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.jobs_folder):
+            if not name.endswith('.json'):
+                continue
+            job_id = name[:-5]
+            job = self.get(job_id)
+            if not job or job['status'] in ACTIVE_STATUSES or job.get('updated_at', 0) >= cutoff:
+                continue
+            fd = self._try_lock(job_id)
+            if fd is None:
+                continue
+            try:
+                os.remove(self._state_path(job_id))
+                os.remove(self._lock_path(job_id))
+                removed += 1
+            except FileNotFoundError:
+                pass
+            finally:
+                self._release(fd)
+        return removed
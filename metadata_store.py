@@ -0,0 +1,1148 @@
+#!/usr/bin/env python3
+"""
+元数据存储层
+提供可插拔的元数据存储后端：
+- json:    兼容原有的 file_metadata.json 整文件读写
+- journal: file_metadata.json 快照 + 追加写的 file_metadata.journal，后台定期压缩
+- sqlite:  SQLite (WAL 模式)，对 uuid / relative_path / date / upload_time 建立索引，
+           单条记录的增删改不再需要重写全部元数据
+
+用法:
+    python metadata_store.py migrate [upload_folder]   # 将 file_metadata.json 一次性迁移到 SQLite
+    python metadata_store.py compact [upload_folder]   # 立即将 journal 日志合并进快照
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+import logging
+import fcntl
+import base64
+import bisect
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILENAME = 'file_metadata.json'
+SQLITE_FILENAME = 'file_metadata.db'
+JOURNAL_FILENAME = 'file_metadata.journal'
+
+# SQLite 中独立成列的字段，其余字段序列化到 extra 列中
+CORE_FIELDS = ('uuid', 'filename', 'relative_path', 'date', 'file_path', 'upload_time', 'file_size')
+
+# 支持的排序字段：排序键函数及对应的SQL表达式，同值时按UUID排序保证顺序唯一
+# 文件名不区分大小写：Python 端用 casefold()，SQLite 端用同样基于 casefold() 的 CASEFOLD 排序规则
+# （SQLite 内置的 lower() 只处理 ASCII），两种后端的顺序和游标一致
+SORT_KEYS = {
+    'upload_time': lambda record: record.get('upload_time', ''),
+    'filename': lambda record: record.get('filename', '').casefold(),
+    'file_size': lambda record: record.get('file_size', 0) or 0,
+    'date': lambda record: record.get('date', ''),
+}
+SORT_SQL = {
+    'upload_time': 'upload_time',
+    'filename': 'filename',
+    'file_size': 'file_size',
+    'date': 'date',
+}
+SORT_COLLATIONS = {
+    'filename': 'CASEFOLD',
+}
+# 游标中排序值应有的类型，与 SORT_KEYS 的返回值一致
+SORT_VALUE_TYPES = {
+    'upload_time': str,
+    'filename': str,
+    'file_size': int,
+    'date': str,
+}
+
+
+def path_has_prefix(path, prefix):
+    """判断 relative_path 是否等于 prefix 或位于其子目录下"""
+    return path == prefix or path.startswith(prefix + '/')
+
+
+def casefold_collation(left, right):
+    """SQLite 排序规则：与 SORT_KEYS['filename'] 相同的 casefold() 比较"""
+    left, right = left.casefold(), right.casefold()
+    return (left > right) - (left < right)
+
+
+def encode_cursor(sort_value, file_uuid):
+    """将最后一条记录的 (排序值, UUID) 编码为游标"""
+    raw = json.dumps([sort_value, file_uuid], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor, sort_by):
+    """解码游标并校验排序值类型与 sort_by 一致，非法时抛出 ValueError"""
+    try:
+        sort_value, file_uuid = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError(f"invalid cursor: {cursor}")
+    expected = SORT_VALUE_TYPES[sort_by]
+    # bool 是 int 的子类，需单独排除
+    if not isinstance(sort_value, expected) or isinstance(sort_value, bool) or not isinstance(file_uuid, str):
+        raise ValueError(f"invalid cursor for sort_by {sort_by}: {cursor}")
+    return (sort_value, file_uuid)
+
+
+class MetadataSnapshot:
+    """某一版本元数据的只读快照及其派生索引
+
+    快照中的记录在多个请求之间共享，调用方不得原地修改，需要附加字段时先复制。
+    """
+
+    def __init__(self, version, records):
+        self.version = version
+        self.records = records
+        self.by_uuid = {record.get('uuid'): record for record in records}
+        self._derived = {}
+        # 派生数据的构建函数可能依赖其他派生数据，使用可重入锁
+        self._derived_lock = threading.RLock()
+
+    def derived(self, name, builder):
+        """获取按需构建并随快照缓存的派生数据，builder 接收记录列表"""
+        if name not in self._derived:
+            with self._derived_lock:
+                if name not in self._derived:
+                    self._derived[name] = builder(self.records)
+        return self._derived[name]
+
+    def by_path_date(self):
+        """(relative_path, date) -> 记录列表，以及 (relative_path, '') 的按路径汇总"""
+        def build(records):
+            index = {}
+            for record in records:
+                path = record.get('relative_path', '')
+                index.setdefault((path, record.get('date', '')), []).append(record)
+                index.setdefault((path, ''), []).append(record)
+            return index
+        return self.derived('by_path_date', build)
+
+    def sorted_view(self, relative_path, date_str, sort_by):
+        """过滤后按 (排序值, UUID) 升序排列的记录及其排序键，按过滤条件和排序字段缓存"""
+        def build(records):
+            if relative_path:
+                matched = self.by_path_date().get((relative_path, date_str), [])
+            elif date_str:
+                matched = [record for record in records if record.get('date') == date_str]
+            else:
+                matched = records
+            if sort_by not in SORT_KEYS:
+                return matched, None
+            sort_key = SORT_KEYS[sort_by]
+            keyed = sorted(((sort_key(record), record.get('uuid', '')), record) for record in matched)
+            return [record for _, record in keyed], [key for key, _ in keyed]
+        return self.derived(('sorted', relative_path, date_str, sort_by), build)
+
+
+class MetadataStore:
+    """元数据存储后端基类
+
+    读路径通过 snapshot() 获取进程内缓存的解析结果，仅当后端的版本标识
+    （文件的 mtime/size/inode 或 SQLite 的代数计数器）或本进程的写入代数变化时才重新加载。
+    """
+
+    def __init__(self):
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        # 本进程内的写入代数，防止同一时间片内的修改无法通过 mtime 区分
+        self._generation = 0
+        # 耗时观察者 observer(event, seconds)，event 为 lock_wait / snapshot_load，用于监控指标
+        self.observer = None
+
+    def _observe(self, event, started):
+        if self.observer is not None:
+            self.observer(event, time.monotonic() - started)
+
+    def _storage_version(self):
+        """后端存储的版本标识，变化即表示需要重新加载"""
+        raise NotImplementedError
+
+    def _load_for_snapshot(self):
+        """加载用于快照的全部记录，失败时抛出异常以免缓存错误结果"""
+        return self.load_all()
+
+    def invalidate(self):
+        """显式使缓存失效"""
+        self._generation += 1
+
+    def snapshot(self):
+        """返回当前版本元数据的缓存快照"""
+        version = (self._storage_version(), self._generation)
+        cache = self._cache
+        if cache is not None and cache.version == version:
+            return cache
+        with self._cache_lock:
+            cache = self._cache
+            if cache is not None and cache.version == version:
+                return cache
+            # 先取版本再加载：即使加载期间有新写入，下次读取也会因版本不同而重新加载
+            started = time.monotonic()
+            self._cache = MetadataSnapshot(version, self._load_for_snapshot())
+            self._observe('snapshot_load', started)
+            return self._cache
+
+    def load_all(self):
+        """读取全部元数据记录"""
+        raise NotImplementedError
+
+    def storage_size(self):
+        """元数据在磁盘上占用的字节数"""
+        raise NotImplementedError
+
+    def replace_all(self, records):
+        """用给定记录整体替换元数据，成功返回True"""
+        raise NotImplementedError
+
+    def get(self, file_uuid):
+        """按UUID读取单条记录的副本，不存在返回None"""
+        record = self.snapshot().by_uuid.get(file_uuid)
+        return dict(record) if record is not None else None
+
+    def get_many(self, file_uuids):
+        """按UUID批量读取记录的副本，返回 {uuid: 记录}，不存在的UUID不出现在结果中"""
+        by_uuid = self.snapshot().by_uuid
+        return {file_uuid: dict(by_uuid[file_uuid]) for file_uuid in file_uuids if file_uuid in by_uuid}
+
+    def modify(self, mutator):
+        """跨进程原子地执行读-改-写：mutator 原地修改记录列表，其返回值作为结果返回"""
+        raise NotImplementedError
+
+    def insert(self, record):
+        """插入一条记录"""
+        raise NotImplementedError
+
+    def insert_many(self, records):
+        """在一次提交中插入多条记录，返回插入的记录列表"""
+        records = list(records)
+        if records:
+            self.modify(lambda existing: existing.extend(records))
+        return records
+
+    def update(self, file_uuid, changes):
+        """按UUID更新记录字段，返回更新后的记录，不存在返回None"""
+        raise NotImplementedError
+
+    def update_many(self, updates):
+        """在一次提交中批量更新记录，updates 为 {uuid: changes}，返回更新条数"""
+        def apply(records):
+            updated = 0
+            for record in records:
+                changes = updates.get(record.get('uuid'))
+                if changes:
+                    record.update(changes)
+                    updated += 1
+            return updated
+        return self.modify(apply) if updates else 0
+
+    def delete(self, file_uuid):
+        """按UUID删除记录，返回被删除的记录，不存在返回None"""
+        raise NotImplementedError
+
+    def delete_many(self, file_uuids):
+        """在一次提交中批量删除记录，返回被删除的记录列表"""
+        targets = set(file_uuids)
+        def apply(records):
+            removed = [record for record in records if record.get('uuid') in targets]
+            records[:] = [record for record in records if record.get('uuid') not in targets]
+            return removed
+        return self.modify(apply) if targets else []
+
+    def query(self, relative_path='', date_str=''):
+        """按路径和日期过滤记录（返回快照中的共享记录，调用方不得修改）"""
+        snapshot = self.snapshot()
+        if not relative_path and not date_str:
+            return snapshot.records
+        if relative_path:
+            return snapshot.by_path_date().get((relative_path, date_str), [])
+        return [record for record in snapshot.records if record.get('date') == date_str]
+
+    def query_tree(self, prefix='', date_str=''):
+        """relative_path 等于 prefix 或位于其子目录下（可选限定日期）的记录，按 (relative_path, date, filename) 排序
+
+        只遍历 (relative_path, date) 分组索引中匹配的分组，返回快照中的共享记录，调用方不得修改。
+        """
+        matched = []
+        for (relative_path, record_date), records in self.snapshot().by_path_date().items():
+            # 未限定日期时使用按路径汇总的 (relative_path, '') 分组
+            if record_date != date_str:
+                continue
+            if not prefix or path_has_prefix(relative_path, prefix):
+                matched.extend(records)
+        matched.sort(key=lambda record: (record.get('relative_path', ''), record.get('date', ''),
+                                         record.get('filename', '')))
+        return matched
+
+    def query_page(self, relative_path='', date_str='', sort_by='upload_time', descending=True,
+                   offset=0, limit=20, cursor=None):
+        """分页查询，返回 (当前页记录, 总数, 下一页游标)
+
+        排序视图按快照缓存，翻页只需 O(log N) 的二分定位加 O(page_size) 的切片。
+        传入 cursor 时使用键集分页（忽略 offset），不支持的排序字段保持存储顺序且不提供游标。
+        """
+        records, keys = self.snapshot().sorted_view(relative_path, date_str, sort_by)
+        total = len(records)
+
+        if keys is None:
+            if cursor:
+                raise ValueError(f"cursor requires a supported sort_by: {sort_by}")
+            return records[offset:offset + limit], total, None
+
+        if cursor:
+            cursor_key = decode_cursor(cursor, sort_by)
+            if descending:
+                end = bisect.bisect_left(keys, cursor_key)
+            else:
+                start = bisect.bisect_right(keys, cursor_key)
+        elif descending:
+            end = max(total - offset, 0)
+        else:
+            start = offset
+
+        if descending:
+            start = max(end - limit, 0)
+            page = records[start:end][::-1]
+            has_more = start > 0
+        else:
+            page = records[start:start + limit]
+            has_more = start + limit < total
+
+        next_cursor = None
+        if page and has_more:
+            next_cursor = encode_cursor(SORT_KEYS[sort_by](page[-1]), page[-1].get('uuid', ''))
+        return page, total, next_cursor
+
+    def count(self):
+        """记录总数"""
+        return len(self.snapshot().records)
+
+    def find_by_file_path(self, file_path):
+        """按文件的绝对路径查找最近一次上传的记录，不存在返回None"""
+        def build(records):
+            # 按上传顺序遍历，同一路径以最后一次上传为准
+            return {os.path.abspath(record.get('file_path', '')): record for record in records}
+        record = self.snapshot().derived('by_file_path', build).get(os.path.abspath(file_path))
+        return dict(record) if record is not None else None
+
+    def directory_stats(self, prefix=''):
+        """按 relative_path 和 date 汇总的现存文件数和字节数：{path: {date: [count, bytes]}}
+
+        prefix 非空时只返回该路径及其子路径。汇总结果随快照缓存，只在元数据变化后重建一次；
+        这里不持久化也不增量维护，每次变化后是一次 O(N) 的遍历（json/journal 后端重新加载快照
+        本身就是 O(N)）。只有 sqlite 后端由触发器持久化增量维护，见 SqliteMetadataStore。
+        """
+        def build(records):
+            stats = {}
+            for record in records:
+                if not record.get('exists', True):
+                    continue
+                by_date = stats.setdefault(record.get('relative_path', ''), {})
+                entry = by_date.setdefault(record.get('date', ''), [0, 0])
+                entry[0] += 1
+                entry[1] += record.get('file_size', 0) or 0
+            return stats
+        stats = self.snapshot().derived('directory_stats', build)
+        if not prefix:
+            return stats
+        return {path: by_date for path, by_date in stats.items() if path_has_prefix(path, prefix)}
+
+
+class JsonMetadataStore(MetadataStore):
+    """基于单个JSON文件的元数据存储（原有实现）
+
+    所有读-改-写操作都在 file_metadata.json.lock 的排他 flock 下完成，
+    保证 gunicorn 多个 worker 进程并发修改时不会互相覆盖记录。
+    """
+
+    def __init__(self, upload_folder):
+        super().__init__()
+        self.metadata_file = os.path.join(upload_folder, METADATA_FILENAME)
+        self.lock_file = self.metadata_file + '.lock'
+        # 进程内线程锁 + 跨进程文件锁
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _exclusive(self):
+        """获取跨进程的排他锁"""
+        started = time.monotonic()
+        with self._lock:
+            with open(self.lock_file, 'a') as lock_fd:
+                fcntl.flock(lock_fd.fileno(), fcntl.LOCK_EX)
+                self._observe('lock_wait', started)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_fd.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _stat_version(path):
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            return None
+
+    def _storage_version(self):
+        return self._stat_version(self.metadata_file)
+
+    def storage_size(self):
+        return sum(os.path.getsize(path) for path in self._storage_files() if os.path.exists(path))
+
+    def _storage_files(self):
+        return [self.metadata_file]
+
+    def _load_for_snapshot(self):
+        return self._read()
+
+    def _read(self):
+        """读取元数据文件，读取失败时抛出异常"""
+        if not os.path.exists(self.metadata_file):
+            return []
+        with open(self.metadata_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, records):
+        """写入临时文件后原子替换，调用方需持有排他锁"""
+        temp_file = f"{self.metadata_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())  # 确保数据写入磁盘
+
+            # 原子性地替换文件
+            os.replace(temp_file, self.metadata_file)
+            self.invalidate()
+        except Exception:
+            # 清理临时文件
+            if os.path.exists(temp_file):
+                try:
+                    os.remove(temp_file)
+                except:
+                    pass
+            raise
+
+    def load_all(self):
+        # 写入使用原子替换，读取无需加锁
+        try:
+            return self._read()
+        except Exception as e:
+            logger.error(f"Error reading metadata: {str(e)}")
+            return []
+
+    def replace_all(self, records):
+        try:
+            with self._exclusive():
+                self._write(records)
+            return True
+        except Exception as e:
+            logger.error(f"Error writing metadata: {str(e)}")
+            return False
+
+    def modify(self, mutator):
+        with self._exclusive():
+            records = self._read()
+            result = mutator(records)
+            self._write(records)
+            return result
+
+    def insert(self, record):
+        self.modify(lambda records: records.append(record))
+        return record
+
+    def update(self, file_uuid, changes):
+        def apply(records):
+            for record in records:
+                if record.get('uuid') == file_uuid:
+                    record.update(changes)
+                    return record
+            return None
+        return self.modify(apply)
+
+    def delete(self, file_uuid):
+        def apply(records):
+            for index, record in enumerate(records):
+                if record.get('uuid') == file_uuid:
+                    return records.pop(index)
+            return None
+        return self.modify(apply)
+
+
+class JournalMetadataStore(JsonMetadataStore):
+    """快照 + 追加日志的元数据存储
+
+    file_metadata.json 作为快照，每次修改（上传、删除、标记已查看）只向
+    file_metadata.journal 追加一行 JSON。读取时在快照之上重放日志；日志超过
+    阈值后由后台线程将其合并为新的快照并清空日志。
+
+    压缩先替换快照再清空日志，不加锁的读取方可能读到旧快照和已清空的日志而丢失记录，
+    因此读取前后比较两个文件的版本（mtime、大小、inode），不一致时重读；多次重读
+    仍不一致（写入非常频繁）时在共享锁下读取。
+    """
+
+    READ_RETRIES = 5
+
+    def __init__(self, upload_folder, compact_threshold=None):
+        super().__init__(upload_folder)
+        self.journal_file = os.path.join(upload_folder, JOURNAL_FILENAME)
+        self.compact_threshold = compact_threshold or int(
+            os.environ.get('METADATA_JOURNAL_COMPACT_BYTES', 1024 * 1024))
+        self._compacting = threading.Event()
+
+    @staticmethod
+    def _replay(records, entries):
+        """在快照记录上依次应用日志条目"""
+        positions = {record.get('uuid'): index for index, record in enumerate(records)}
+        for entry in entries:
+            op = entry.get('op')
+            if op == 'insert':
+                record = entry['record']
+                index = positions.get(record['uuid'])
+                if index is None or records[index] is None:
+                    positions[record['uuid']] = len(records)
+                    records.append(record)
+                else:
+                    records[index] = record
+            elif op == 'update':
+                index = positions.get(entry['uuid'])
+                if index is not None and records[index] is not None:
+                    records[index].update(entry['changes'])
+            elif op == 'delete':
+                index = positions.pop(entry['uuid'], None)
+                if index is not None:
+                    records[index] = None
+        return [record for record in records if record is not None]
+
+    def _storage_version(self):
+        return (self._stat_version(self.metadata_file), self._stat_version(self.journal_file))
+
+    def _storage_files(self):
+        return [self.metadata_file, self.journal_file]
+
+    def _read_journal(self):
+        """读取日志条目，忽略崩溃时可能残留的不完整行"""
+        if not os.path.exists(self.journal_file):
+            return []
+        entries = []
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Skipping corrupt journal entry in {self.journal_file}")
+        return entries
+
+    def _read(self):
+        # 持有排他锁的写入方读取时版本不会变化，第一次即返回
+        for _ in range(self.READ_RETRIES):
+            version = self._storage_version()
+            records = self._replay(super()._read(), self._read_journal())
+            if self._storage_version() == version:
+                return records
+        with self._lock, open(self.lock_file, 'a') as lock_fd:
+            fcntl.flock(lock_fd.fileno(), fcntl.LOCK_SH)
+            try:
+                return self._replay(super()._read(), self._read_journal())
+            finally:
+                fcntl.flock(lock_fd.fileno(), fcntl.LOCK_UN)
+
+    def _write(self, records):
+        # 先原子替换快照再清空日志
+        super()._write(records)
+        with open(self.journal_file, 'w', encoding='utf-8') as f:
+            os.fsync(f.fileno())
+
+    def _append(self, *entries):
+        """追加日志条目（一次写入、一次fsync），调用方需持有排他锁"""
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        self.invalidate()
+        if size >= self.compact_threshold:
+            self._schedule_compaction()
+
+    def _schedule_compaction(self):
+        """日志超过阈值时启动后台压缩线程（每个进程同时最多一个）"""
+        if self._compacting.is_set():
+            return
+        self._compacting.set()
+        threading.Thread(target=self._compact_in_background, name='metadata-compaction', daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"Error compacting metadata journal: {str(e)}")
+        finally:
+            self._compacting.clear()
+
+    def compact(self, force=False):
+        """将日志合并进快照，返回是否执行了压缩"""
+        with self._exclusive():
+            if not force and (not os.path.exists(self.journal_file)
+                              or os.path.getsize(self.journal_file) < self.compact_threshold):
+                return False
+            records = self._read()
+            self._write(records)
+        logger.info(f"Compacted metadata journal into snapshot: {len(records)} records")
+        return True
+
+    def insert(self, record):
+        with self._exclusive():
+            self._append({'op': 'insert', 'record': record})
+        return record
+
+    def insert_many(self, records):
+        records = list(records)
+        if records:
+            with self._exclusive():
+                self._append(*({'op': 'insert', 'record': record} for record in records))
+        return records
+
+    def update(self, file_uuid, changes):
+        with self._exclusive():
+            # 持有排他锁期间版本不会变化，快照即为最新状态
+            record = self.get(file_uuid)
+            if record is None:
+                return None
+            self._append({'op': 'update', 'uuid': file_uuid, 'changes': changes})
+        record.update(changes)
+        return record
+
+    def update_many(self, updates):
+        with self._exclusive():
+            by_uuid = self.snapshot().by_uuid
+            entries = [
+                {'op': 'update', 'uuid': file_uuid, 'changes': changes}
+                for file_uuid, changes in updates.items()
+                if changes and file_uuid in by_uuid
+            ]
+            if entries:
+                self._append(*entries)
+        return len(entries)
+
+    def delete(self, file_uuid):
+        with self._exclusive():
+            record = self.get(file_uuid)
+            if record is None:
+                return None
+            self._append({'op': 'delete', 'uuid': file_uuid})
+        return record
+
+    def delete_many(self, file_uuids):
+        with self._exclusive():
+            by_uuid = self.snapshot().by_uuid
+            removed = [dict(by_uuid[file_uuid]) for file_uuid in dict.fromkeys(file_uuids) if file_uuid in by_uuid]
+            if removed:
+                self._append(*({'op': 'delete', 'uuid': record['uuid']} for record in removed))
+        return removed
+
+
+class SqliteMetadataStore(MetadataStore):
+    """基于SQLite (WAL模式) 的元数据存储"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            uuid          TEXT PRIMARY KEY,
+            filename      TEXT NOT NULL,
+            relative_path TEXT NOT NULL DEFAULT '',
+            date          TEXT NOT NULL DEFAULT '',
+            file_path     TEXT NOT NULL,
+            upload_time   TEXT NOT NULL,
+            file_size     INTEGER NOT NULL DEFAULT 0,
+            extra         TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS idx_files_relative_path ON files (relative_path);
+        CREATE INDEX IF NOT EXISTS idx_files_path_date ON files (relative_path, date);
+        -- 排序索引以 uuid 结尾，与键集游标比较的 (排序值, uuid) 一致
+        DROP INDEX IF EXISTS idx_files_date;
+        DROP INDEX IF EXISTS idx_files_upload_time;
+        DROP INDEX IF EXISTS idx_files_filename;
+        CREATE INDEX IF NOT EXISTS idx_files_date_uuid ON files (date, uuid);
+        CREATE INDEX IF NOT EXISTS idx_files_upload_time_uuid ON files (upload_time, uuid);
+        CREATE INDEX IF NOT EXISTS idx_files_file_path ON files (file_path);
+        CREATE INDEX IF NOT EXISTS idx_files_filename_casefold ON files (filename COLLATE CASEFOLD, uuid);
+        CREATE INDEX IF NOT EXISTS idx_files_file_size ON files (file_size, uuid);
+        CREATE INDEX IF NOT EXISTS idx_files_path_upload_time ON files (relative_path, upload_time);
+        CREATE INDEX IF NOT EXISTS idx_files_path_date_upload_time ON files (relative_path, date, upload_time);
+        CREATE TABLE IF NOT EXISTS store_meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+        -- 代数计数器：任何进程修改 files 表都会使其递增，用于进程内缓存失效
+        INSERT OR IGNORE INTO store_meta (key, value) VALUES ('generation', 0);
+        CREATE TRIGGER IF NOT EXISTS files_generation_insert AFTER INSERT ON files BEGIN
+            UPDATE store_meta SET value = value + 1 WHERE key = 'generation';
+        END;
+        CREATE TRIGGER IF NOT EXISTS files_generation_update AFTER UPDATE ON files BEGIN
+            UPDATE store_meta SET value = value + 1 WHERE key = 'generation';
+        END;
+        CREATE TRIGGER IF NOT EXISTS files_generation_delete AFTER DELETE ON files BEGIN
+            UPDATE store_meta SET value = value + 1 WHERE key = 'generation';
+        END;
+        -- 按 relative_path / date 汇总的现存文件数和字节数，由触发器随 files 表增量维护
+        CREATE TABLE IF NOT EXISTS directory_stats (
+            relative_path TEXT NOT NULL,
+            date          TEXT NOT NULL,
+            file_count    INTEGER NOT NULL DEFAULT 0,
+            total_bytes   INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (relative_path, date)
+        );
+        CREATE TRIGGER IF NOT EXISTS directory_stats_insert AFTER INSERT ON files
+        WHEN coalesce(json_extract(new.extra, '$.exists'), 1) BEGIN
+            INSERT INTO directory_stats (relative_path, date, file_count, total_bytes)
+            VALUES (new.relative_path, new.date, 1, new.file_size)
+            ON CONFLICT (relative_path, date) DO UPDATE SET
+                file_count = file_count + 1,
+                total_bytes = total_bytes + excluded.total_bytes;
+        END;
+        CREATE TRIGGER IF NOT EXISTS directory_stats_delete AFTER DELETE ON files
+        WHEN coalesce(json_extract(old.extra, '$.exists'), 1) BEGIN
+            UPDATE directory_stats SET file_count = file_count - 1, total_bytes = total_bytes - old.file_size
+            WHERE relative_path = old.relative_path AND date = old.date;
+            DELETE FROM directory_stats
+            WHERE relative_path = old.relative_path AND date = old.date AND file_count <= 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS directory_stats_update_old AFTER UPDATE ON files
+        WHEN coalesce(json_extract(old.extra, '$.exists'), 1) BEGIN
+            UPDATE directory_stats SET file_count = file_count - 1, total_bytes = total_bytes - old.file_size
+            WHERE relative_path = old.relative_path AND date = old.date;
+            DELETE FROM directory_stats
+            WHERE relative_path = old.relative_path AND date = old.date AND file_count <= 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS directory_stats_update_new AFTER UPDATE ON files
+        WHEN coalesce(json_extract(new.extra, '$.exists'), 1) BEGIN
+            INSERT INTO directory_stats (relative_path, date, file_count, total_bytes)
+            VALUES (new.relative_path, new.date, 1, new.file_size)
+            ON CONFLICT (relative_path, date) DO UPDATE SET
+                file_count = file_count + 1,
+                total_bytes = total_bytes + excluded.total_bytes;
+        END;
+    """
+
+    def __init__(self, upload_folder, db_path=None):
+        super().__init__()
+        self.upload_folder = upload_folder
+        self.db_path = db_path or os.path.join(upload_folder, SQLITE_FILENAME)
+        # 每个线程使用独立连接
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        self._migrate_from_json_once()
+        self._build_directory_stats_once()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # 文件名排序索引依赖该排序规则，所有连接都必须注册
+            conn.create_collation('CASEFOLD', casefold_collation)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def _storage_version(self):
+        row = self._connect().execute("SELECT value FROM store_meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else None
+
+    def storage_size(self):
+        return sum(os.path.getsize(path) for path in (self.db_path, self.db_path + '-wal') if os.path.exists(path))
+
+    def _begin(self, conn):
+        """开始写事务（等待其他进程释放写锁）"""
+        started = time.monotonic()
+        conn.execute('BEGIN IMMEDIATE')
+        self._observe('lock_wait', started)
+
+    @staticmethod
+    def _to_row(record):
+        extra = {k: v for k, v in record.items() if k not in CORE_FIELDS}
+        return (
+            record['uuid'],
+            record.get('filename', ''),
+            record.get('relative_path', ''),
+            record.get('date', ''),
+            record.get('file_path', ''),
+            record.get('upload_time', ''),
+            record.get('file_size', 0) or 0,
+            json.dumps(extra, ensure_ascii=False),
+        )
+
+    @staticmethod
+    def _from_row(row):
+        record = {field: row[field] for field in CORE_FIELDS}
+        record.update(json.loads(row['extra'] or '{}'))
+        return record
+
+    UPDATE_SQL = ('UPDATE files SET filename = ?, relative_path = ?, date = ?, file_path = ?, '
+                  'upload_time = ?, file_size = ?, extra = ? WHERE uuid = ?')
+
+    @staticmethod
+    def _update_params(values):
+        """_to_row 的结果转换为 UPDATE_SQL 的参数（uuid 在最后）"""
+        return values[1:] + values[:1]
+
+    def _insert_rows(self, conn, records):
+        conn.executemany(
+            'INSERT OR REPLACE INTO files '
+            '(uuid, filename, relative_path, date, file_path, upload_time, file_size, extra) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [self._to_row(record) for record in records]
+        )
+
+    def _migrate_from_json_once(self):
+        """首次启用时自动从 file_metadata.json 迁移"""
+        conn = self._connect()
+        self._begin(conn)
+        try:
+            row = conn.execute("SELECT value FROM store_meta WHERE key = 'json_migrated'").fetchone()
+            if row is None:
+                migrated = 0
+                if os.path.exists(os.path.join(self.upload_folder, METADATA_FILENAME)):
+                    records = [r for r in JournalMetadataStore(self.upload_folder)._read() if r.get('uuid')]
+                    self._insert_rows(conn, records)
+                    migrated = len(records)
+                    logger.info(f"Migrated {migrated} metadata records from {METADATA_FILENAME} to {self.db_path}")
+                conn.execute("INSERT INTO store_meta (key, value) VALUES ('json_migrated', ?)", (str(migrated),))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _build_directory_stats_once(self):
+        """为引入汇总表之前创建的数据库补建汇总数据"""
+        conn = self._connect()
+        self._begin(conn)
+        try:
+            if conn.execute("SELECT 1 FROM store_meta WHERE key = 'directory_stats_built'").fetchone() is None:
+                conn.execute('DELETE FROM directory_stats')
+                conn.execute(
+                    "INSERT INTO directory_stats (relative_path, date, file_count, total_bytes) "
+                    "SELECT relative_path, date, COUNT(*), SUM(file_size) FROM files "
+                    "WHERE coalesce(json_extract(extra, '$.exists'), 1) GROUP BY relative_path, date"
+                )
+                conn.execute("INSERT INTO store_meta (key, value) VALUES ('directory_stats_built', 1)")
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def find_by_file_path(self, file_path):
+        row = self._connect().execute(
+            'SELECT * FROM files WHERE file_path = ? ORDER BY upload_time DESC LIMIT 1',
+            (os.path.abspath(file_path),)
+        ).fetchone()
+        return self._from_row(row) if row else None
+
+    def directory_stats(self, prefix=''):
+        sql = 'SELECT relative_path, date, file_count, total_bytes FROM directory_stats'
+        params = []
+        if prefix:
+            sql += ' WHERE relative_path = ? OR substr(relative_path, 1, ?) = ?'
+            params = [prefix, len(prefix) + 1, prefix + '/']
+        stats = {}
+        for row in self._connect().execute(sql, params):
+            stats.setdefault(row['relative_path'], {})[row['date']] = [row['file_count'], row['total_bytes']]
+        return stats
+
+    def load_all(self):
+        rows = self._connect().execute('SELECT * FROM files ORDER BY rowid').fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def replace_all(self, records):
+        conn = self._connect()
+        try:
+            self._begin(conn)
+            conn.execute('DELETE FROM files')
+            self._insert_rows(conn, records)
+            conn.execute('COMMIT')
+            return True
+        except Exception as e:
+            logger.error(f"Error writing metadata: {str(e)}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            return False
+
+    def modify(self, mutator):
+        """在一个事务中读-改-写，只删除、插入、更新实际变化的行，汇总表触发器也只对这些行执行"""
+        conn = self._connect()
+        self._begin(conn)
+        try:
+            records = [self._from_row(row) for row in conn.execute('SELECT * FROM files ORDER BY rowid')]
+            # mutator 可能原地修改记录，先保存修改前的行用于比较
+            original = {record['uuid']: self._to_row(record) for record in records}
+            result = mutator(records)
+            current = {record['uuid']: record for record in records}
+
+            removed = [file_uuid for file_uuid in original if file_uuid not in current]
+            for start in range(0, len(removed), 500):
+                batch = removed[start:start + 500]
+                conn.execute(f"DELETE FROM files WHERE uuid IN ({','.join('?' * len(batch))})", batch)
+            changed = []
+            for file_uuid, record in current.items():
+                values = self._to_row(record)
+                if file_uuid in original and original[file_uuid] != values:
+                    changed.append(self._update_params(values))
+            conn.executemany(self.UPDATE_SQL, changed)
+            self._insert_rows(conn, [record for file_uuid, record in current.items() if file_uuid not in original])
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def get(self, file_uuid):
+        row = self._connect().execute('SELECT * FROM files WHERE uuid = ?', (file_uuid,)).fetchone()
+        return self._from_row(row) if row else None
+
+    def get_many(self, file_uuids):
+        file_uuids = list(dict.fromkeys(file_uuids))
+        conn = self._connect()
+        found = {}
+        # 分批拼接 IN 条件走主键索引，避免超过 SQLite 的参数个数限制
+        for start in range(0, len(file_uuids), 500):
+            batch = file_uuids[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            for row in conn.execute(f'SELECT * FROM files WHERE uuid IN ({placeholders})', batch):
+                found[row['uuid']] = self._from_row(row)
+        return found
+
+    def insert(self, record):
+        self.insert_many([record])
+        return record
+
+    def insert_many(self, records):
+        records = list(records)
+        if not records:
+            return records
+        conn = self._connect()
+        self._begin(conn)
+        try:
+            self._insert_rows(conn, records)
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        return records
+
+    def _update_row(self, conn, file_uuid, changes):
+        """在当前事务中更新一条记录，返回更新后的记录"""
+        row = conn.execute('SELECT * FROM files WHERE uuid = ?', (file_uuid,)).fetchone()
+        if row is None:
+            return None
+        record = self._from_row(row)
+        record.update(changes)
+        conn.execute(self.UPDATE_SQL, self._update_params(self._to_row(record)))
+        return record
+
+    def update(self, file_uuid, changes):
+        conn = self._connect()
+        self._begin(conn)
+        try:
+            record = self._update_row(conn, file_uuid, changes)
+            conn.execute('COMMIT')
+            return record
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def update_many(self, updates):
+        if not updates:
+            return 0
+        conn = self._connect()
+        self._begin(conn)
+        try:
+            updated = sum(
+                1 for file_uuid, changes in updates.items()
+                if changes and self._update_row(conn, file_uuid, changes) is not None
+            )
+            conn.execute('COMMIT')
+            return updated
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, file_uuid):
+        conn = self._connect()
+        self._begin(conn)
+        try:
+            row = conn.execute('SELECT * FROM files WHERE uuid = ?', (file_uuid,)).fetchone()
+            if row is None:
+                conn.execute('ROLLBACK')
+                return None
+            conn.execute('DELETE FROM files WHERE uuid = ?', (file_uuid,))
+            conn.execute('COMMIT')
+            return self._from_row(row)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def delete_many(self, file_uuids):
+        file_uuids = list(dict.fromkeys(file_uuids))
+        if not file_uuids:
+            return []
+        conn = self._connect()
+        self._begin(conn)
+        try:
+            removed = []
+            # 分批拼接 IN 条件，避免超过 SQLite 的参数个数限制
+            for start in range(0, len(file_uuids), 500):
+                batch = file_uuids[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                removed.extend(self._from_row(row) for row in conn.execute(
+                    f'SELECT * FROM files WHERE uuid IN ({placeholders})', batch))
+                conn.execute(f'DELETE FROM files WHERE uuid IN ({placeholders})', batch)
+            conn.execute('COMMIT')
+            return removed
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _where(relative_path, date_str):
+        conditions = []
+        params = []
+        if relative_path:
+            conditions.append('relative_path = ?')
+            params.append(relative_path)
+        if date_str:
+            conditions.append('date = ?')
+            params.append(date_str)
+        return conditions, params
+
+    def query(self, relative_path='', date_str=''):
+        sql = 'SELECT * FROM files'
+        conditions, params = self._where(relative_path, date_str)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY rowid'
+        return [self._from_row(row) for row in self._connect().execute(sql, params).fetchall()]
+
+    def query_tree(self, prefix='', date_str=''):
+        conditions = []
+        params = []
+        if prefix:
+            # 子目录用范围条件表示（'0' 是 '/' 的下一个字符），可以使用 relative_path 索引
+            conditions.append('(relative_path = ? OR (relative_path >= ? AND relative_path < ?))')
+            params.extend([prefix, prefix + '/', prefix + '0'])
+        if date_str:
+            conditions.append('date = ?')
+            params.append(date_str)
+        sql = 'SELECT * FROM files'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY relative_path, date, filename'
+        return [self._from_row(row) for row in self._connect().execute(sql, params)]
+
+    def query_page(self, relative_path='', date_str='', sort_by='upload_time', descending=True,
+                   offset=0, limit=20, cursor=None):
+        # 直接使用SQL索引排序分页，无需加载全部记录
+        conn = self._connect()
+        conditions, params = self._where(relative_path, date_str)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        total = conn.execute('SELECT COUNT(*) FROM files' + where, params).fetchone()[0]
+
+        if sort_by not in SORT_SQL:
+            if cursor:
+                raise ValueError(f"cursor requires a supported sort_by: {sort_by}")
+            rows = conn.execute(f'SELECT * FROM files{where} ORDER BY rowid LIMIT ? OFFSET ?',
+                                params + [limit, offset]).fetchall()
+            return [self._from_row(row) for row in rows], total, None
+
+        expr = SORT_SQL[sort_by]
+        collate = f' COLLATE {SORT_COLLATIONS[sort_by]}' if sort_by in SORT_COLLATIONS else ''
+        direction = 'DESC' if descending else 'ASC'
+        page_conditions = list(conditions)
+        page_params = list(params)
+        if cursor:
+            # 排序规则写在参数一侧，列保持原样，SQLite 才能按索引直接定位到游标处
+            page_conditions.append(f"({expr}, uuid) {'<' if descending else '>'} (?{collate}, ?)")
+            page_params.extend(decode_cursor(cursor, sort_by))
+            offset = 0
+        page_where = ' WHERE ' + ' AND '.join(page_conditions) if page_conditions else ''
+        # 多取一条用于判断是否还有下一页
+        rows = conn.execute(
+            f'SELECT * FROM files{page_where} ORDER BY {expr}{collate} {direction}, uuid {direction} LIMIT ? OFFSET ?',
+            page_params + [limit + 1, offset]
+        ).fetchall()
+        page = [self._from_row(row) for row in rows[:limit]]
+
+        next_cursor = None
+        if page and len(rows) > limit:
+            next_cursor = encode_cursor(SORT_KEYS[sort_by](page[-1]), page[-1]['uuid'])
+        return page, total, next_cursor
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+
+METADATA_BACKENDS = {
+    'json': JsonMetadataStore,
+    'journal': JournalMetadataStore,
+    'sqlite': SqliteMetadataStore,
+}
+
+
+def create_metadata_store(upload_folder, backend=None):
+    """根据配置创建元数据存储后端（环境变量 METADATA_BACKEND，默认 json）"""
+    backend = (backend or os.environ.get('METADATA_BACKEND', 'json')).lower()
+    if backend not in METADATA_BACKENDS:
+        raise ValueError(f"Unsupported metadata backend: {backend}")
+    logger.info(f"Using metadata backend: {backend}")
+    return METADATA_BACKENDS[backend](upload_folder)
+
+
+def migrate_json_to_sqlite(upload_folder):
+    """将 file_metadata.json（及未压缩的日志）中的全部记录一次性导入 SQLite，返回导入条数"""
+    json_file = os.path.join(upload_folder, METADATA_FILENAME)
+    if not os.path.exists(json_file):
+        print("元数据文件不存在")
+        return 0
+
+    # 同时包含 journal 后端尚未压缩的日志
+    records = [r for r in JournalMetadataStore(upload_folder)._read() if r.get('uuid')]
+
+    store = SqliteMetadataStore(upload_folder)
+    conn = store._connect()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        store._insert_rows(conn, records)
+        conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('json_migrated', ?)", (str(len(records)),))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    print(f"迁移完成！共导入 {len(records)} 条记录 -> {store.db_path}")
+    print(f"数据库记录总数: {store.count()}")
+    return len(records)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == 'migrate':
+        logging.basicConfig(level=logging.INFO)
+        migrate_json_to_sqlite(sys.argv[2] if len(sys.argv) > 2 else 'uploads')
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'compact':
+        logging.basicConfig(level=logging.INFO)
+        JournalMetadataStore(sys.argv[2] if len(sys.argv) > 2 else 'uploads').compact(force=True)
+    else:
+        print(__doc__)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Prometheus 监控指标
+- 依赖可选的 prometheus_client，未安装时所有记录函数为空操作，/metrics 返回 503
+- 按路由统计请求数、延迟直方图、请求/响应字节数；元数据存储各操作的耗时、写锁等待时间、
+  快照重新加载时间；解压任务耗时；抓取时实时读取元数据记录数和占用的磁盘空间
+- gunicorn 多 worker 部署时设置 PROMETHEUS_MULTIPROC_DIR，各 worker 把指标写入该目录下的
+  mmap 文件，任一 worker 响应 /metrics 时汇总所有 worker 的数据（gunicorn.conf.py 负责在启动时
+  清空目录、在 worker 退出时标记）
+"""
+
+import os
+import time
+import logging
+import functools
+
+from flask import g, request
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+    )
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    generate_latest = None
+
+logger = logging.getLogger(__name__)
+
+ENABLED = generate_latest is not None
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if ENABLED and MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STORE_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+EXTRACTION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# 计时的元数据存储操作
+STORE_OPERATIONS = (
+    'snapshot', 'load_all', 'replace_all', 'modify', 'insert', 'insert_many', 'update', 'update_many',
+    'delete', 'delete_many', 'query_page', 'count',
+)
+
+if ENABLED:
+    REQUESTS = Counter('http_requests_total', 'HTTP requests', ['method', 'endpoint', 'status'])
+    REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Time until the view returned a response',
+                                ['method', 'endpoint'], buckets=LATENCY_BUCKETS)
+    REQUEST_BYTES = Counter('http_request_bytes_total', 'Request body bytes', ['endpoint'])
+    RESPONSE_BYTES = Counter('http_response_bytes_total', 'Response body bytes', ['endpoint'])
+    STORE_OPERATION_LATENCY = Histogram('metadata_operation_duration_seconds', 'Metadata store operation latency',
+                                        ['operation'], buckets=STORE_BUCKETS)
+    STORE_LOCK_WAIT = Histogram('metadata_lock_wait_seconds', 'Time waiting for the metadata write lock',
+                                buckets=STORE_BUCKETS)
+    STORE_SNAPSHOT_LOAD = Histogram('metadata_snapshot_load_seconds', 'Time reloading the metadata snapshot',
+                                    buckets=STORE_BUCKETS)
+    EXTRACTION_DURATION = Histogram('extraction_duration_seconds', 'Archive extraction job duration',
+                                    ['status'], buckets=EXTRACTION_BUCKETS)
+
+
+# 元数据记录数和磁盘占用的收集器，instrument_store 时创建
+_store_collector = None
+
+
+class _CountingIterable:
+    """统计流式响应实际发送的字节数"""
+
+    def __init__(self, iterable, endpoint):
+        self._iterable = iterable
+        self._endpoint = endpoint
+
+    def __iter__(self):
+        sent = 0
+        try:
+            for chunk in self._iterable:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            RESPONSE_BYTES.labels(self._endpoint).inc(sent)
+
+    def close(self):
+        if hasattr(self._iterable, 'close'):
+            self._iterable.close()
+
+
+class _StoreCollector:
+    """抓取时读取元数据记录数和磁盘占用，不依赖各 worker 的 Gauge 状态"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def collect(self):
+        records = GaugeMetricFamily('metadata_records', 'Metadata record count')
+        size = GaugeMetricFamily('metadata_storage_bytes', 'Metadata storage size on disk')
+        try:
+            records.add_metric([], self.store.count())
+            size.add_metric([], self.store.storage_size())
+        except Exception as e:
+            logger.warning(f"Failed to collect metadata metrics: {str(e)}")
+        yield records
+        yield size
+
+
+def _endpoint():
+    # 使用路由模板而不是实际路径，避免标签数量随文件数增长
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def init_app(app):
+    """为所有请求记录请求数、延迟和字节数"""
+    if not ENABLED:
+        return
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        endpoint = _endpoint()
+        REQUEST_LATENCY.labels(request.method, endpoint).observe(time.perf_counter() - started)
+        REQUESTS.labels(request.method, endpoint, str(response.status_code)).inc()
+        if request.content_length:
+            REQUEST_BYTES.labels(endpoint).inc(request.content_length)
+        if response.content_length is not None:
+            RESPONSE_BYTES.labels(endpoint).inc(response.content_length)
+        elif response.is_streamed:
+            response.response = _CountingIterable(response.response, endpoint)
+        return response
+
+
+def instrument_store(store):
+    """为元数据存储的各操作计时，并记录写锁等待和快照加载时间"""
+    if not ENABLED:
+        return
+
+    def observe(event, seconds):
+        if event == 'lock_wait':
+            STORE_LOCK_WAIT.observe(seconds)
+        elif event == 'snapshot_load':
+            STORE_SNAPSHOT_LOAD.observe(seconds)
+
+    store.observer = observe
+    for operation in STORE_OPERATIONS:
+        method = getattr(store, operation, None)
+        if method is not None:
+            setattr(store, operation, _timed(method, STORE_OPERATION_LATENCY.labels(operation)))
+
+    global _store_collector
+    _store_collector = _StoreCollector(store)
+    if not MULTIPROC_DIR:
+        REGISTRY.register(_store_collector)
+
+
+def _timed(method, histogram):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+def observe_extraction(seconds, status):
+    if ENABLED:
+        EXTRACTION_DURATION.labels(status).observe(seconds)
+
+
+def render():
+    """生成 /metrics 的响应内容，返回 (内容, Content-Type)；未安装 prometheus_client 时返回 None"""
+    if not ENABLED:
+        return None
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        if _store_collector is not None:
+            registry.register(_store_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
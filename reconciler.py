@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+元数据与磁盘文件对账
+- 按批在线程池中检查每条记录对应的文件，刷新 exists / current_size，可选删除文件已不存在的记录
+- 遍历上传目录，找出没有元数据记录的孤儿文件，可选登记（adopt）或删除
+- 所有修改通过服务使用的同一存储层批量提交（json 后端持有文件锁，sqlite 后端在事务中完成）
+- 增量模式只检查上次运行之后有条目增删的目录：目录的 mtime 在其中文件创建、删除、
+  重命名时都会变化，未变化目录中的记录和文件不需要重新检查
+- dry-run 只输出计划，不做任何修改
+
+用法:
+    python reconciler.py [uploads] [--dry-run] [--incremental] [--prune-missing] [--orphans report|adopt|delete]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from metadata_store import create_metadata_store
+
+logger = logging.getLogger(__name__)
+
+STATE_FILENAME = '.reconcile_state.json'
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# 服务自身生成、不属于上传文件的目录和文件
+SKIPPED_DIR_SUFFIXES = ('_extracted', '.staging', '.trash')
+SKIPPED_FILE_SUFFIXES = ('.part', '.link', '.tmp', '.lock')
+
+
+def is_service_dir(name):
+    """隐藏目录（.tmp/.partial/.blobs/.compressed/.jobs 等）和解压目录不参与孤儿文件检查"""
+    return name.startswith('.') or name.endswith(SKIPPED_DIR_SUFFIXES)
+
+
+def is_service_file(name):
+    return name.startswith('.') or name.startswith('file_metadata.') or name.endswith(SKIPPED_FILE_SUFFIXES)
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class Reconciler:
+    """元数据对账器"""
+
+    def __init__(self, store, upload_folder, workers=8, batch_size=500, orphan_min_age=600):
+        self.store = store
+        self.upload_folder = os.path.abspath(upload_folder)
+        self.workers = workers
+        self.batch_size = batch_size
+        # 刚落盘、尚未登记元数据的上传文件不算孤儿
+        self.orphan_min_age = orphan_min_age
+        self.state_path = os.path.join(self.upload_folder, STATE_FILENAME)
+
+    def expected_path(self, record):
+        """按 relative_path/date/filename 推算文件在当前上传目录中的位置"""
+        parts = [part for part in (record.get('relative_path', ''), record.get('date', ''), record.get('filename', '')) if part]
+        return os.path.join(self.upload_folder, *parts)
+
+    def resolve_path(self, record):
+        """返回 (实际路径, 是否存在)；记录中的路径来自其他挂载点（如容器内 /app/uploads）时按推算位置查找"""
+        file_path = record.get('file_path', '')
+        if file_path and os.path.exists(file_path):
+            return file_path, True
+        expected = self.expected_path(record)
+        if expected != file_path and os.path.exists(expected):
+            return expected, True
+        return file_path, False
+
+    def _check_batch(self, records):
+        results = []
+        for record in records:
+            path, exists = self.resolve_path(record)
+            try:
+                size = os.path.getsize(path) if exists else 0
+            except OSError:
+                exists, size = False, 0
+            results.append((record, path, exists, size))
+        return results
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        temp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def _scan_directories(self, since):
+        """遍历上传目录，返回 (变化过的目录集合, 这些目录中的文件列表)
+
+        since 为 None 时所有目录都视为变化过。
+        """
+        changed_dirs = set()
+        files = []
+        stack = [self.upload_folder]
+        while stack:
+            directory = stack.pop()
+            try:
+                changed = since is None or os.stat(directory).st_mtime > since
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            if changed:
+                changed_dirs.add(directory)
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not is_service_dir(entry.name):
+                        stack.append(entry.path)
+                elif changed and entry.is_file(follow_symlinks=False) and not is_service_file(entry.name):
+                    files.append(entry.path)
+        return changed_dirs, files
+
+    def _adopt(self, path):
+        """为孤儿文件生成元数据记录，路径不符合 <relative_path>/<date>/<filename> 时返回 None"""
+        parts = os.path.relpath(path, self.upload_folder).split(os.sep)
+        if len(parts) < 2 or not DATE_PATTERN.match(parts[-2]):
+            return None
+        st = os.stat(path)
+        return {
+            'uuid': str(uuid.uuid4()),
+            'filename': parts[-1],
+            'relative_path': '/'.join(parts[:-2]),
+            'date': parts[-2],
+            'file_path': path,
+            'upload_time': datetime.fromtimestamp(st.st_mtime).isoformat(),
+            'file_size': st.st_size,
+            'exists': True,
+            'current_size': st.st_size,
+            'sha256': file_sha256(path),
+        }
+
+    def run(self, dry_run=False, incremental=False, prune_missing=False, orphans='report', rewrite_paths=False):
+        """执行一次对账，返回统计结果
+
+        orphans: ignore 不检查孤儿文件，report 只报告，adopt 登记为新记录，delete 删除文件
+        """
+        started = time.time()
+        state = self._load_state()
+        since = state.get('last_run') if incremental else None
+        if orphans == 'ignore' and since is None:
+            changed_dirs, disk_files = None, []
+        else:
+            changed_dirs, disk_files = self._scan_directories(since)
+
+        all_records = self.store.snapshot().records
+        records = all_records
+        if since is not None:
+            # 只检查所在目录有变化或已不存在的记录
+            dir_exists = {}
+
+            def needs_check(record):
+                directories = {
+                    os.path.dirname(os.path.abspath(record.get('file_path', ''))),
+                    os.path.dirname(self.expected_path(record)),
+                }
+                for directory in directories:
+                    if directory in changed_dirs:
+                        return True
+                    if directory not in dir_exists:
+                        dir_exists[directory] = os.path.isdir(directory)
+                return not any(dir_exists[directory] for directory in directories)
+
+            records = [record for record in all_records if needs_check(record)]
+
+        batches = [records[i:i + self.batch_size] for i in range(0, len(records), self.batch_size)]
+        updates = {}
+        missing = []
+        known_paths = {os.path.abspath(record.get('file_path', '')) for record in all_records}
+        known_paths.update(self.expected_path(record) for record in all_records)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for results in pool.map(self._check_batch, batches):
+                for record, path, exists, size in results:
+                    if not exists:
+                        missing.append(record['uuid'])
+                    changes = {}
+                    if record.get('exists') != exists or record.get('current_size') != size:
+                        changes.update({'exists': exists, 'current_size': size})
+                    if rewrite_paths and exists and path != record.get('file_path'):
+                        changes['file_path'] = path
+                    if changes:
+                        updates[record['uuid']] = changes
+
+        now = time.time()
+        orphan_files = [
+            path for path in disk_files
+            if os.path.abspath(path) not in known_paths and now - os.path.getmtime(path) >= self.orphan_min_age
+        ] if orphans != 'ignore' else []
+
+        report = {
+            'mode': 'incremental' if since is not None else 'full',
+            'dry_run': dry_run,
+            'checked_records': len(records),
+            'missing_files': len(missing),
+            'updated_records': 0,
+            'pruned_records': 0,
+            'orphan_files': len(orphan_files),
+            'adopted_orphans': 0,
+            'deleted_orphans': 0,
+        }
+
+        if dry_run:
+            report['updated_records'] = len(updates)
+            report['pruned_records'] = len(missing) if prune_missing else 0
+            report['orphans'] = [os.path.relpath(path, self.upload_folder) for path in orphan_files[:100]]
+            report['elapsed'] = round(time.time() - started, 3)
+            return report
+
+        if prune_missing and missing:
+            report['pruned_records'] = len(self.store.delete_many(missing))
+            for file_uuid in missing:
+                updates.pop(file_uuid, None)
+        report['updated_records'] = self.store.update_many(updates)
+
+        if orphans == 'adopt':
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                adopted = [record for record in pool.map(self._adopt, orphan_files) if record]
+            # 一次提交登记全部孤儿文件，json 后端只重写一次元数据文件
+            report['adopted_orphans'] = len(self.store.insert_many(adopted))
+        elif orphans == 'delete':
+            for path in orphan_files:
+                try:
+                    os.remove(path)
+                    report['deleted_orphans'] += 1
+                except OSError as e:
+                    logger.warning(f"Failed to delete orphan file {path}: {str(e)}")
+
+        # 增量模式的基准时间取本次开始时间，期间发生的变化留给下次处理
+        if orphans != 'ignore' or since is not None:
+            self._save_state({'last_run': started})
+        report['elapsed'] = round(time.time() - started, 3)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='元数据与磁盘文件对账')
+    parser.add_argument('upload_folder', nargs='?', default=os.environ.get('UPLOAD_FOLDER', 'uploads'))
+    parser.add_argument('--backend', default=None, help='元数据存储后端，默认读取 METADATA_BACKEND')
+    parser.add_argument('--dry-run', action='store_true', help='只输出计划，不做修改')
+    parser.add_argument('--incremental', action='store_true', help='只检查上次运行后有变化的目录')
+    parser.add_argument('--prune-missing', action='store_true', help='删除文件已不存在的记录（默认只标记 exists=false）')
+    parser.add_argument('--orphans', choices=['ignore', 'report', 'adopt', 'delete'], default='report',
+                        help='没有元数据记录的文件的处理方式')
+    parser.add_argument('--rewrite-paths', action='store_true', help='把记录中的文件路径改写为在当前上传目录中找到的位置')
+    parser.add_argument('--workers', type=int, default=8, help='检查文件的线程数')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批检查的记录数')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = create_metadata_store(args.upload_folder, args.backend)
+    reconciler = Reconciler(store, args.upload_folder, workers=args.workers, batch_size=args.batch_size)
+    report = reconciler.run(
+        dry_run=args.dry_run,
+        incremental=args.incremental,
+        prune_missing=args.prune_missing,
+        orphans=args.orphans,
+        rewrite_paths=args.rewrite_paths,
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
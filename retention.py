@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+报告保留策略与限速清理
+保留规则按 relative_path 前缀配置，每条记录归属前缀最长的规则：
+- max_age_days: 按 date 或 upload_time 字段（age_field）计算的最长保留天数
+- keep_last_dates: 每个 relative_path 只保留最近 N 个日期
+- max_total_bytes: 前缀下文件总大小上限，超出时从最旧的开始删除
+
+规则示例（RETENTION_RULES 环境变量或 RETENTION_CONFIG 指向的 JSON 文件）:
+    [
+        {"prefix": "", "max_age_days": 180},
+        {"prefix": "perf", "max_age_days": 30, "age_field": "upload_time", "max_total_bytes": 53687091200},
+        {"prefix": "nightly", "keep_last_dates": 14}
+    ]
+
+用法（只输出清理计划）:
+    python retention.py uploads --rules rules.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+from metadata_store import create_metadata_store, path_has_prefix
+
+logger = logging.getLogger(__name__)
+
+AGE_FIELDS = ('date', 'upload_time')
+
+
+class RetentionRule:
+    """单条保留规则"""
+
+    def __init__(self, prefix='', max_age_days=None, age_field='date', keep_last_dates=None, max_total_bytes=None):
+        if age_field not in AGE_FIELDS:
+            raise ValueError(f"age_field must be one of {AGE_FIELDS}: {age_field}")
+        self.prefix = prefix.strip('/')
+        self.max_age_days = max_age_days
+        self.age_field = age_field
+        self.keep_last_dates = keep_last_dates
+        self.max_total_bytes = max_total_bytes
+
+    @classmethod
+    def from_dict(cls, data):
+        unknown = set(data) - {'prefix', 'max_age_days', 'age_field', 'keep_last_dates', 'max_total_bytes'}
+        if unknown:
+            raise ValueError(f"Unknown retention rule fields: {sorted(unknown)}")
+        return cls(**data)
+
+    def matches(self, relative_path):
+        return not self.prefix or path_has_prefix(relative_path, self.prefix)
+
+
+def load_rules(text=None, path=None):
+    """从 JSON 文本或文件加载规则列表，都未提供时返回空列表"""
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    if not text:
+        return []
+    return [RetentionRule.from_dict(item) for item in json.loads(text)]
+
+
+def record_age_time(record, field):
+    """记录的本地时间（不带时区），无法解析时返回 None（不参与按时间清理）"""
+    value = record.get(field, '')
+    try:
+        if field == 'date':
+            return datetime.strptime(value, '%Y-%m-%d')
+        # Python 3.11 之前的 fromisoformat 不接受 Z 后缀
+        timestamp = datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    except (TypeError, ValueError):
+        return None
+    if timestamp.tzinfo is not None:
+        # 导入或迁移的记录可能带时区，统一转换为本地时间后再与 now 比较
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+
+def record_order_key(record):
+    """从旧到新的排序键"""
+    return (record.get('date', ''), record.get('upload_time', ''))
+
+
+def plan_purge(records, rules, now=None):
+    """计算需要清理的记录，返回 [(记录, 原因)]，按从旧到新排列"""
+    now = now or datetime.now()
+    # 每条记录归属前缀最长的规则
+    ordered_rules = sorted(rules, key=lambda rule: len(rule.prefix), reverse=True)
+    by_rule = {id(rule): [] for rule in rules}
+    for record in records:
+        for rule in ordered_rules:
+            if rule.matches(record.get('relative_path', '')):
+                by_rule[id(rule)].append(record)
+                break
+
+    purge = {}
+    for rule in rules:
+        rule_records = sorted(by_rule[id(rule)], key=record_order_key)
+
+        if rule.max_age_days is not None:
+            cutoff = now - timedelta(days=rule.max_age_days)
+            for record in rule_records:
+                timestamp = record_age_time(record, rule.age_field)
+                if timestamp is not None and timestamp < cutoff:
+                    purge.setdefault(record['uuid'], (record, f'older than {rule.max_age_days} days'))
+
+        if rule.keep_last_dates is not None:
+            dates_by_path = {}
+            for record in rule_records:
+                dates_by_path.setdefault(record.get('relative_path', ''), set()).add(record.get('date', ''))
+            kept = {
+                path: set(sorted(dates, reverse=True)[:rule.keep_last_dates])
+                for path, dates in dates_by_path.items()
+            }
+            for record in rule_records:
+                if record.get('date', '') not in kept[record.get('relative_path', '')]:
+                    purge.setdefault(record['uuid'], (record, f'beyond last {rule.keep_last_dates} dates'))
+
+        if rule.max_total_bytes is not None:
+            remaining = [record for record in rule_records if record['uuid'] not in purge]
+            total = sum(record.get('file_size') or 0 for record in remaining)
+            for record in remaining:
+                if total <= rule.max_total_bytes:
+                    break
+                purge[record['uuid']] = (record, f'prefix exceeds {rule.max_total_bytes} bytes')
+                total -= record.get('file_size') or 0
+
+    return sorted(purge.values(), key=lambda item: record_order_key(item[0]))
+
+
+class Throttle:
+    """按文件数和字节数限速：每批处理后睡眠到平均速率不超过上限"""
+
+    def __init__(self, max_files_per_second=0, max_bytes_per_second=0):
+        self.max_files_per_second = max_files_per_second
+        self.max_bytes_per_second = max_bytes_per_second
+        self._started = time.monotonic()
+        self._files = 0
+        self._bytes = 0
+
+    def consume(self, files, size):
+        self._files += files
+        self._bytes += size
+        required = 0.0
+        if self.max_files_per_second:
+            required = max(required, self._files / self.max_files_per_second)
+        if self.max_bytes_per_second:
+            required = max(required, self._bytes / self.max_bytes_per_second)
+        delay = required - (time.monotonic() - self._started)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Purger:
+    """按保留规则分批清理文件和元数据
+
+    元数据按批通过 delete_many 在一次提交中删除，目录汇总随之更新；之后对没有其他记录
+    引用同一路径（如之后重新上传的同名文件）的记录调用 remove_files(record) 删除文件
+    （及解压目录、缓存等），返回释放的字节数。
+    """
+
+    def __init__(self, store, rules, remove_files, batch_size=100,
+                 max_files_per_second=50, max_bytes_per_second=200 * 1024 * 1024):
+        self.store = store
+        self.rules = rules
+        self.remove_files = remove_files
+        self.batch_size = batch_size
+        self.max_files_per_second = max_files_per_second
+        self.max_bytes_per_second = max_bytes_per_second
+
+    def plan(self):
+        return plan_purge(self.store.snapshot().records, self.rules)
+
+    def run(self, dry_run=False):
+        """执行一次清理，返回统计结果"""
+        started = time.time()
+        plan = self.plan() if self.rules else []
+        report = {
+            'dry_run': dry_run,
+            'planned_records': len(plan),
+            'planned_bytes': sum(record.get('file_size') or 0 for record, _ in plan),
+            'purged_records': 0,
+            'freed_bytes': 0,
+            'errors': 0,
+        }
+        if dry_run:
+            report['sample'] = [
+                {'path': f"{record.get('relative_path', '')}/{record.get('date', '')}/{record.get('filename', '')}",
+                 'reason': reason}
+                for record, reason in plan[:100]
+            ]
+            return report
+
+        throttle = Throttle(self.max_files_per_second, self.max_bytes_per_second)
+        for start in range(0, len(plan), self.batch_size):
+            batch = plan[start:start + self.batch_size]
+            removed = self.store.delete_many([record['uuid'] for record, _ in batch])
+            freed = 0
+            for record in removed:
+                # 先删除元数据再查找，同一批中共用路径的记录也只在最后一条删除后才删除文件
+                if self.store.find_by_file_path(record.get('file_path', '')) is not None:
+                    continue
+                try:
+                    freed += self.remove_files(record)
+                except Exception as e:
+                    report['errors'] += 1
+                    logger.error(f"Retention purge failed for {record.get('file_path')}: {str(e)}")
+            report['purged_records'] += len(removed)
+            report['freed_bytes'] += freed
+            throttle.consume(len(batch), freed)
+
+        report['elapsed'] = round(time.time() - started, 3)
+        if report['purged_records']:
+            logger.info(f"Retention purge: {report['purged_records']} record(s), {report['freed_bytes']} bytes freed")
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按保留规则输出清理计划（实际清理由服务内的后台线程执行）')
+    parser.add_argument('upload_folder', nargs='?', default=os.environ.get('UPLOAD_FOLDER', 'uploads'))
+    parser.add_argument('--backend', default=None, help='元数据存储后端，默认读取 METADATA_BACKEND')
+    parser.add_argument('--rules', default=os.environ.get('RETENTION_CONFIG'), help='规则 JSON 文件，默认读取 RETENTION_CONFIG / RETENTION_RULES')
+    args = parser.parse_args()
+
+    rules = load_rules(os.environ.get('RETENTION_RULES'), args.rules)
+    store = create_metadata_store(args.upload_folder, args.backend)
+    report = Purger(store, rules, remove_files=None).run(dry_run=True)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+报告全文检索索引
+- 基于 SQLite FTS5，保存在 uploads/.search/index.db，与元数据存储后端无关
+- 每个上传文件一条文档：文件名、压缩包成员名、HTML/文本内容；解压目录中的文本类文件各一条文档
+- 上传、生成压缩包清单、解压完成后在后台增量写入；巡检时补齐缺失的文档、删除已不存在记录的文档
+- 查询按 bm25 排序（文件名 > 成员名 > 内容），支持路径前缀、日期范围过滤和分页
+"""
+
+import os
+import html
+import codecs
+import sqlite3
+import logging
+import threading
+from html.parser import HTMLParser
+
+logger = logging.getLogger(__name__)
+
+HTML_EXTENSIONS = {'.html', '.htm', '.xml', '.svg'}
+# JUnit 等 XML 报告的测试名、失败信息在属性中，所有属性值都建立索引
+XML_EXTENSIONS = {'.xml'}
+TEXT_EXTENSIONS = {'.txt', '.log', '.json', '.csv', '.md', '.yaml', '.yml', '.ini', '.out'}
+
+# 每个文件最多读取的字节数
+DEFAULT_MAX_CONTENT_BYTES = 4 * 1024 * 1024
+
+# 命中数不超过该值时按相关度排序
+DEFAULT_MAX_RANKED = 10000
+
+# 各列的 bm25 权重：filename, members, content
+RANK_WEIGHTS = (10.0, 4.0, 1.0)
+RANK_ARGS = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+
+# snippet 高亮标记，转义后替换为 <mark>
+HIGHLIGHT_START = '\x01'
+HIGHLIGHT_END = '\x02'
+
+SKIPPED_TAGS = {'script', 'style', 'noscript'}
+# pytest-html 等报告把测试数据放在 data-* 属性中，同样建立索引
+INDEXED_ATTRIBUTES = {'title', 'alt'}
+
+
+class _TextExtractor(HTMLParser):
+    """提取 HTML 中的可见文本及 title/alt/data-* 属性值（all_attributes 时提取所有属性值）"""
+
+    def __init__(self, all_attributes=False):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.all_attributes = all_attributes
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        for name, value in attrs:
+            if value and (self.all_attributes or name in INDEXED_ATTRIBUTES or name.startswith('data-')):
+                self.parts.append(value)
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth and not data.isspace():
+            self.parts.append(data)
+
+
+def is_indexable(path):
+    return os.path.splitext(path)[1].lower() in HTML_EXTENSIONS | TEXT_EXTENSIONS
+
+
+def extract_text(path, max_bytes=DEFAULT_MAX_CONTENT_BYTES):
+    """读取文件开头最多 max_bytes 字节，返回可检索的文本；不支持的类型返回空字符串"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in HTML_EXTENSIONS and ext not in TEXT_EXTENSIONS:
+        return ''
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    parser = _TextExtractor(ext in XML_EXTENSIONS) if ext in HTML_EXTENSIONS else None
+    parts = []
+    remaining = max_bytes
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(1024 * 1024, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            text = decoder.decode(chunk)
+            if parser:
+                parser.feed(text)
+            else:
+                parts.append(text)
+    text = decoder.decode(b'', final=True)
+    if parser:
+        parser.feed(text)
+        parser.close()
+        return '\n'.join(parser.parts)
+    parts.append(text)
+    return ''.join(parts)
+
+
+def build_match_expression(query):
+    """把用户输入转换为 FTS5 查询：每个词作为短语（避免特殊字符引起语法错误），词之间为 AND，末尾 * 表示前缀匹配"""
+    terms = []
+    for word in query.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ('*' if prefix else ''))
+    if not terms:
+        raise ValueError('query is empty')
+    return ' '.join(terms)
+
+
+def render_snippet(snippet):
+    """转义 snippet 文本并把高亮标记替换为 <mark>"""
+    return (html.escape(snippet or '', quote=False)
+            .replace(HIGHLIGHT_START, '<mark>')
+            .replace(HIGHLIGHT_END, '</mark>'))
+
+
+class SearchIndex:
+    """全文检索索引"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            id            INTEGER PRIMARY KEY,
+            doc_key       TEXT NOT NULL UNIQUE,
+            file_uuid     TEXT NOT NULL,
+            kind          TEXT NOT NULL,
+            relative_path TEXT NOT NULL DEFAULT '',
+            date          TEXT NOT NULL DEFAULT '',
+            filename      TEXT NOT NULL DEFAULT '',
+            path          TEXT NOT NULL DEFAULT '',
+            mtime_ns      INTEGER NOT NULL DEFAULT 0,
+            size          INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_documents_file_uuid ON documents (file_uuid, kind);
+        CREATE INDEX IF NOT EXISTS idx_documents_path_date ON documents (relative_path, date);
+        CREATE INDEX IF NOT EXISTS idx_documents_date ON documents (date);
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+            filename, members, content, tokenize = 'unicode61 remove_diacritics 2'
+        );
+    """
+
+    def __init__(self, db_path, max_content_bytes=DEFAULT_MAX_CONTENT_BYTES, max_ranked=DEFAULT_MAX_RANKED):
+        self.db_path = db_path
+        self.max_content_bytes = max_content_bytes
+        self.max_ranked = max_ranked
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # 每个线程使用独立连接
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def _delete_where(self, conn, condition, params):
+        conn.execute(f'DELETE FROM documents_fts WHERE rowid IN (SELECT id FROM documents WHERE {condition})', params)
+        return conn.execute(f'DELETE FROM documents WHERE {condition}', params).rowcount
+
+    def _upsert(self, conn, doc_key, fields, filename, members, content):
+        row = conn.execute('SELECT id FROM documents WHERE doc_key = ?', (doc_key,)).fetchone()
+        columns = ('file_uuid', 'kind', 'relative_path', 'date', 'filename', 'path', 'mtime_ns', 'size')
+        values = [fields.get(column, '') for column in columns]
+        if row:
+            doc_id = row['id']
+            conn.execute('DELETE FROM documents_fts WHERE rowid = ?', (doc_id,))
+            conn.execute(f"UPDATE documents SET {', '.join(c + ' = ?' for c in columns)} WHERE id = ?", values + [doc_id])
+        else:
+            doc_id = conn.execute(
+                f"INSERT INTO documents (doc_key, {', '.join(columns)}) VALUES (?{', ?' * len(columns)})",
+                [doc_key] + values
+            ).lastrowid
+        conn.execute('INSERT INTO documents_fts (rowid, filename, members, content) VALUES (?, ?, ?, ?)',
+                     (doc_id, filename, members, content))
+
+    def is_current(self, file_uuid, st):
+        row = self._connect().execute(
+            "SELECT mtime_ns, size FROM documents WHERE doc_key = ?", (file_uuid,)
+        ).fetchone()
+        return row is not None and row['mtime_ns'] == st.st_mtime_ns and row['size'] == st.st_size
+
+    def index_record(self, record, relative_to, listing=None, force=False):
+        """为上传文件建立或更新文档，listing 为压缩包清单；文件未变化且未指定 force 时跳过，返回是否写入"""
+        file_path = record.get('file_path', '')
+        st = os.stat(file_path)
+        if not force and self.is_current(record['uuid'], st):
+            return False
+        content = extract_text(file_path, self.max_content_bytes)
+        members = '\n'.join(listing['names']) if listing else ''
+        fields = {
+            'file_uuid': record['uuid'],
+            'kind': 'file',
+            'relative_path': record.get('relative_path', ''),
+            'date': record.get('date', ''),
+            'filename': record.get('filename', ''),
+            'path': os.path.relpath(file_path, relative_to),
+            'mtime_ns': st.st_mtime_ns,
+            'size': st.st_size,
+        }
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._upsert(conn, record['uuid'], fields, record.get('filename', ''), members, content)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def index_tree(self, record, directory, relative_to, max_files=10000, batch_size=200):
+        """为解压目录中的文本类文件建立文档（先删除该记录旧的解压文档），返回写入的文档数"""
+        paths = []
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if is_indexable(name):
+                    paths.append(os.path.join(root, name))
+        paths.sort()
+        if len(paths) > max_files:
+            logger.warning(f"Search index: {directory} has {len(paths)} text files, indexing first {max_files}")
+            paths = paths[:max_files]
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._delete_where(conn, "file_uuid = ? AND kind = 'extracted'", (record['uuid'],))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        indexed = 0
+        for start in range(0, len(paths), batch_size):
+            documents = []
+            for path in paths[start:start + batch_size]:
+                try:
+                    st = os.stat(path)
+                    documents.append((path, st, extract_text(path, self.max_content_bytes)))
+                except OSError as e:
+                    logger.warning(f"Search index skipped {path}: {str(e)}")
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for path, st, content in documents:
+                    member = os.path.relpath(path, directory)
+                    fields = {
+                        'file_uuid': record['uuid'],
+                        'kind': 'extracted',
+                        'relative_path': record.get('relative_path', ''),
+                        'date': record.get('date', ''),
+                        'filename': os.path.basename(path),
+                        'path': os.path.relpath(path, relative_to),
+                        'mtime_ns': st.st_mtime_ns,
+                        'size': st.st_size,
+                    }
+                    self._upsert(conn, f"{record['uuid']}:{member}", fields, member, '', content)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            indexed += len(documents)
+        return indexed
+
+    def remove(self, file_uuid):
+        """删除记录对应的所有文档（含解压文件），返回删除数"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            removed = self._delete_where(conn, 'file_uuid = ?', (file_uuid,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return removed
+
+    def indexed_uuids(self):
+        rows = self._connect().execute("SELECT file_uuid FROM documents WHERE kind = 'file'").fetchall()
+        return {row[0] for row in rows}
+
+    def sync(self, records, relative_to, listing_loader=None, extract_dir_for=None, max_records=5000):
+        """补齐缺少文档的记录、删除已没有记录的文档，每次最多补齐 max_records 条，返回 (新增数, 删除数)"""
+        indexed = self.indexed_uuids()
+        current = {record['uuid'] for record in records}
+        removed = 0
+        for file_uuid in indexed - current:
+            removed += bool(self.remove(file_uuid))
+
+        added = 0
+        for record in records:
+            if added >= max_records:
+                break
+            if record['uuid'] in indexed or not record.get('exists', True):
+                continue
+            try:
+                listing = listing_loader(record) if listing_loader else None
+                self.index_record(record, relative_to, listing, force=True)
+                directory = extract_dir_for(record) if extract_dir_for else None
+                if directory and os.path.isdir(directory):
+                    self.index_tree(record, directory, relative_to)
+                added += 1
+            except OSError:
+                # 文件已不存在，等待巡检更新状态
+                continue
+        return added, removed
+
+    def search(self, query, relative_path='', date_from='', date_to='', kind='', offset=0, limit=20):
+        """全文检索，返回 (结果列表, 总数, 总数是否为下限)
+
+        命中数超过 max_ranked 时 bm25 需要为每条命中计算得分，此时改为按写入顺序从新到旧返回，
+        总数只统计到 max_ranked 为止。
+        """
+        conditions = ['documents_fts MATCH ?']
+        params = [build_match_expression(query)]
+        if relative_path:
+            relative_path = relative_path.strip('/')
+            conditions.append('(d.relative_path = ? OR substr(d.relative_path, 1, ?) = ?)')
+            params.extend([relative_path, len(relative_path) + 1, relative_path + '/'])
+        if date_from:
+            conditions.append('d.date >= ?')
+            params.append(date_from)
+        if date_to:
+            conditions.append('d.date <= ?')
+            params.append(date_to)
+        if kind:
+            conditions.append('d.kind = ?')
+            params.append(kind)
+        where = ' AND '.join(conditions)
+
+        conn = self._connect()
+        total = conn.execute(
+            f"""SELECT COUNT(*) FROM (SELECT 1 FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid
+                WHERE {where} LIMIT ?)""",
+            params + [self.max_ranked + 1]
+        ).fetchone()[0]
+        capped = total > self.max_ranked
+        order = 'documents_fts.rowid DESC' if capped else 'rank'
+        rows = conn.execute(
+            f"""SELECT d.*, bm25(documents_fts, {RANK_ARGS}) AS rank,
+                       snippet(documents_fts, -1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16) AS snippet
+                FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid
+                WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?""",
+            params + [limit, offset]
+        ).fetchall()
+        results = [{
+            'uuid': row['file_uuid'],
+            'kind': row['kind'],
+            'filename': row['filename'],
+            'relative_path': row['relative_path'],
+            'date': row['date'],
+            'path': row['path'],
+            'score': round(-row['rank'], 4),
+            'snippet': render_snippet(row['snippet']),
+        } for row in rows]
+        return results, min(total, self.max_ranked), capped
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM documents').fetchone()[0]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+压缩包解压测试
+
+用法:
+    python -m pytest test_archives.py
+    python test_archives.py
+"""
+
+import os
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import subprocess
+import unittest
+
+import archives
+from archives import ArchiveError
+
+
+def make_report_dir(root):
+    report_dir = os.path.join(root, 'report')
+    os.makedirs(os.path.join(report_dir, 'css'))
+    with open(os.path.join(report_dir, 'index.html'), 'w') as f:
+        f.write('<html>ok</html>')
+    with open(os.path.join(report_dir, 'css', 'app.css'), 'w') as f:
+        f.write('body{}')
+    return report_dir
+
+
+class ExtractTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='test_archives_')
+        self.dest = os.path.join(self.root, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def assert_report_extracted(self):
+        with open(os.path.join(self.dest, 'index.html')) as f:
+            self.assertEqual(f.read(), '<html>ok</html>')
+        self.assertTrue(os.path.isfile(os.path.join(self.dest, 'css', 'app.css')))
+
+    def test_tar_of_current_directory(self):
+        """tar czf x.tgz -C dir . 产生 ./ 以及 ./index.html 等成员"""
+        report_dir = make_report_dir(self.root)
+        path = os.path.join(self.root, 'x.tgz')
+        if shutil.which('tar'):
+            subprocess.run(['tar', 'czf', path, '-C', report_dir, '.'], check=True)
+        else:
+            with tarfile.open(path, 'w:gz') as archive:
+                archive.add(report_dir, arcname='.')
+        with tarfile.open(path) as archive:
+            self.assertIn(archive.getnames()[0].rstrip('/'), ('.', ''))
+
+        files, _ = archives.extract(path, self.dest)
+        self.assertEqual(files, 2)
+        self.assert_report_extracted()
+
+    def test_zip_with_current_directory_entry(self):
+        path = os.path.join(self.root, 'x.zip')
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('./', '')
+            archive.writestr('./index.html', '<html>ok</html>')
+            archive.writestr('css/app.css', 'body{}')
+
+        files, _ = archives.extract(path, self.dest)
+        self.assertEqual(files, 2)
+        self.assert_report_extracted()
+
+    def test_escaping_members_are_rejected(self):
+        for name in ('../evil.txt', 'a/../../evil.txt', '/etc/evil.txt', 'C:/evil.txt'):
+            with self.subTest(name=name):
+                with self.assertRaises(ArchiveError):
+                    archives.safe_target(self.dest, name)
+
+    @unittest.skipIf(archives.py7zr is None, 'py7zr is not installed')
+    def test_7z_limit_checked_before_writing(self):
+        source = os.path.join(self.root, 'big.bin')
+        with open(source, 'wb') as f:
+            f.write(b'\0' * (1024 * 1024))
+        path = os.path.join(self.root, 'bomb.7z')
+        with archives.py7zr.SevenZipFile(path, 'w') as archive:
+            archive.write(source, 'big.bin')
+
+        with self.assertRaises(ArchiveError):
+            archives.extract(path, self.dest, max_total_size=64 * 1024)
+        self.assertFalse(os.path.exists(os.path.join(self.dest, 'big.bin')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+大文本窗口接口 /text 测试
+
+用法:
+    python -m pytest test_text_window.py
+    python test_text_window.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+UPLOAD_FOLDER = tempfile.mkdtemp(prefix='test_text_window_')
+os.environ['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+os.environ['FILE_STATE_RECONCILE_INTERVAL'] = '0'
+os.environ['RETENTION_INTERVAL'] = '0'
+os.environ['MAX_TEXT_WINDOW_LINES'] = '5000'
+os.environ['MAX_TEXT_WINDOW_BYTES'] = '4096'
+
+import app as app_module  # noqa: E402
+
+LINE_COUNT = 15000
+
+
+class TextWindowTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = app_module.app.test_client()
+        directory = os.path.join(UPLOAD_FOLDER, 'logs', '2025-01-01')
+        os.makedirs(directory, exist_ok=True)
+        cls.path = os.path.join(directory, 'big.log')
+        with open(cls.path, 'w') as f:
+            for i in range(LINE_COUNT):
+                f.write(f'line {i}\n')
+        with open(cls.path, 'rb') as f:
+            cls.content = f.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(UPLOAD_FOLDER, ignore_errors=True)
+
+    def test_tail_lines_larger_than_limit_returns_last_lines(self):
+        data = self.client.get('/text/logs/2025-01-01/big.log?tail=10000').get_json()
+        self.assertEqual(data['offset'], LINE_COUNT - 5000)
+        self.assertEqual(data['length'], 5000)
+        self.assertTrue(data['eof'])
+        self.assertEqual(data['lines'][0], f'line {LINE_COUNT - 5000}')
+        self.assertEqual(data['lines'][-1], f'line {LINE_COUNT - 1}')
+
+    def test_tail_bytes_larger_than_limit_returns_last_bytes(self):
+        data = self.client.get('/text/logs/2025-01-01/big.log?unit=bytes&tail=10000').get_json()
+        self.assertEqual(data['offset'], len(self.content) - 4096)
+        self.assertEqual(data['length'], 4096)
+        self.assertTrue(data['eof'])
+        self.assertEqual(data['content'], self.content[-4096:].decode())
+
+    def test_tail_within_limit(self):
+        data = self.client.get('/text/logs/2025-01-01/big.log?tail=3').get_json()
+        self.assertEqual(data['lines'], [f'line {i}' for i in range(LINE_COUNT - 3, LINE_COUNT)])
+
+    def test_negative_tail_is_rejected(self):
+        response = self.client.get('/text/logs/2025-01-01/big.log?tail=-5')
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+大文本文件预览
+- 流式生成 HTML 预览页：按块读取、解码并转义，内存占用与文件大小无关
+- 行偏移索引：每隔 INDEX_STRIDE 行记录一次字节偏移，首次访问时扫描一遍文件建立，
+  保存在 uploads/.lineindex/ 下供所有 worker 复用；按行号读取窗口时只需定位到最近的
+  索引点再向后读取少量行
+"""
+
+import os
+import json
+import html
+import codecs
+import shutil
+import logging
+import threading
+import uuid
+from array import array
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# 每隔多少行记录一个偏移，500MB / 500 万行的日志索引约 40KB
+INDEX_STRIDE = 1000
+
+# 单行超过该长度时截断返回
+MAX_LINE_BYTES = 64 * 1024
+
+PREVIEW_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>文本预览 - {name}</title>
+    <style>
+        body {{ font-family: 'Courier New', monospace; padding: 20px; background: #f5f5f5; }}
+        .container {{ background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
+        pre {{ white-space: pre-wrap; word-wrap: break-word; margin: 0; }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h2>文件: {name}</h2>
+        <pre>"""
+
+PREVIEW_TAIL = """</pre>
+    </div>
+</body>
+</html>
+"""
+
+
+def stream_text_preview(path, chunk_size=CHUNK_SIZE):
+    """逐块生成文本文件的 HTML 预览页"""
+    yield PREVIEW_HEAD.format(name=html.escape(os.path.basename(path)))
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            text = decoder.decode(chunk)
+            if text:
+                yield html.escape(text, quote=False)
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield html.escape(text, quote=False)
+    yield PREVIEW_TAIL
+
+
+def read_byte_window(path, offset, length):
+    """读取 [offset, offset + length) 字节，offset 为负数时从文件末尾倒数"""
+    size = os.path.getsize(path)
+    if offset < 0:
+        offset = max(size + offset, 0)
+    offset = min(offset, size)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    return {
+        'size': size,
+        'offset': offset,
+        'length': len(data),
+        'next_offset': offset + len(data),
+        'eof': offset + len(data) >= size,
+        'content': data.decode('utf-8', errors='replace'),
+    }
+
+
+def _read_line(f, limit):
+    """读取一行，超长时截断并跳过该行剩余部分，返回 (内容, 是否截断)"""
+    line = f.readline(limit)
+    if not line or line.endswith(b'\n') or len(line) < limit:
+        return line, False
+    while True:
+        rest = f.readline(CHUNK_SIZE)
+        if not rest or rest.endswith(b'\n'):
+            return line, True
+
+
+class LineIndex:
+    """单个文件的稀疏行偏移索引"""
+
+    def __init__(self, mtime_ns, size, total_lines, offsets, stride=INDEX_STRIDE):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.total_lines = total_lines
+        self.offsets = offsets
+        self.stride = stride
+
+    @classmethod
+    def build(cls, path, stride=INDEX_STRIDE):
+        """扫描一遍文件建立索引"""
+        st = os.stat(path)
+        offsets = array('Q', [0])
+        total_lines = 0
+        position = 0
+        last_byte = b''
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                newlines = chunk.count(b'\n')
+                if total_lines + newlines >= len(offsets) * stride:
+                    index = -1
+                    for _ in range(newlines):
+                        index = chunk.index(b'\n', index + 1)
+                        total_lines += 1
+                        if total_lines % stride == 0:
+                            offsets.append(position + index + 1)
+                else:
+                    total_lines += newlines
+                position += len(chunk)
+                last_byte = chunk[-1:]
+        # 最后一行没有换行符时也计为一行
+        if last_byte and last_byte != b'\n':
+            total_lines += 1
+        return cls(st.st_mtime_ns, st.st_size, total_lines, offsets, stride)
+
+    def matches(self, st):
+        return self.mtime_ns == st.st_mtime_ns and self.size == st.st_size
+
+    def dump(self, path):
+        header = {'mtime_ns': self.mtime_ns, 'size': self.size, 'total_lines': self.total_lines, 'stride': self.stride}
+        with open(path, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            self.offsets.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            offsets = array('Q')
+            offsets.frombytes(f.read())
+        return cls(header['mtime_ns'], header['size'], header['total_lines'], offsets, header['stride'])
+
+    def read_lines(self, path, start, count):
+        """读取第 start 行起的 count 行（行号从 0 开始），返回 (行列表, 截断的行号列表)"""
+        start = max(0, min(start, self.total_lines))
+        end = min(start + count, self.total_lines)
+        lines, truncated = [], []
+        with open(path, 'rb') as f:
+            f.seek(self.offsets[start // self.stride])
+            for _ in range(start % self.stride):
+                _read_line(f, MAX_LINE_BYTES)
+            for number in range(start, end):
+                line, was_truncated = _read_line(f, MAX_LINE_BYTES)
+                if not line:
+                    break
+                if was_truncated:
+                    truncated.append(number)
+                lines.append(line.rstrip(b'\r\n').decode('utf-8', errors='replace'))
+        return lines, truncated
+
+
+class LineIndexCache:
+    """行偏移索引缓存：进程内 LRU + 磁盘持久化，文件 mtime 或大小变化时重建"""
+
+    def __init__(self, root_folder, cache_folder, max_entries=64):
+        self.root_folder = os.path.abspath(root_folder)
+        self.cache_folder = cache_folder
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index_path(self, source_path):
+        relative = os.path.relpath(os.path.abspath(source_path), self.root_folder)
+        return os.path.join(self.cache_folder, relative + '.idx')
+
+    def get(self, source_path):
+        """返回文件的行索引，必要时从磁盘加载或重新建立"""
+        source_path = os.path.abspath(source_path)
+        st = os.stat(source_path)
+        with self._lock:
+            index = self._entries.get(source_path)
+            if index is not None and index.matches(st):
+                self._entries.move_to_end(source_path)
+                return index
+
+        index_path = self._index_path(source_path)
+        index = None
+        try:
+            index = LineIndex.load(index_path)
+            if not index.matches(st):
+                index = None
+        except (OSError, ValueError, KeyError):
+            index = None
+
+        if index is None:
+            index = LineIndex.build(source_path)
+            try:
+                os.makedirs(os.path.dirname(index_path), exist_ok=True)
+                temp_path = f"{index_path}.{uuid.uuid4().hex}.tmp"
+                index.dump(temp_path)
+                os.replace(temp_path, index_path)
+            except OSError as e:
+                logger.warning(f"Failed to persist line index for {source_path}: {str(e)}")
+
+        with self._lock:
+            self._entries[source_path] = index
+            self._entries.move_to_end(source_path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+    def remove(self, source_path):
+        """源文件删除时一并删除其索引"""
+        source_path = os.path.abspath(source_path)
+        with self._lock:
+            self._entries.pop(source_path, None)
+        try:
+            os.remove(self._index_path(source_path))
+        except FileNotFoundError:
+            pass
+
+    def remove_tree(self, directory):
+        """源目录删除时一并删除其索引目录"""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(directory + os.sep)]:
+                del self._entries[path]
+        index_dir = self._index_path(directory)
+        if os.path.isdir(index_dir):
+            shutil.rmtree(index_dir, ignore_errors=True)